@@ -4,9 +4,16 @@ import pysam, gzip
 import numpy as np
 transNuc={"A":"T","T":"A","C":"G","G":"C","N":"N","-":"-"}
 
-def run_RNA_MaP(input_file, output, del_thred, insertion_thred, all, gz):
+def open_alignment(input_file, reference=None, threads=1):
+    # CRAM is decoded against the reference FASTA, or REF_PATH/REF_CACHE without one;
+    # threads > 1 lets htslib decompress blocks in parallel with the counting
+    if input_file.endswith('.cram'):
+        return pysam.AlignmentFile(input_file, "rc", reference_filename=reference, threads=threads)
+    return pysam.AlignmentFile(input_file, "rb", threads=threads)
+
+def run_RNA_MaP(input_file, output, del_thred, insertion_thred, all, gz, reference=None, threads=1):
     
-    bamfile = pysam.AlignmentFile(input_file, "rb")
+    bamfile = open_alignment(input_file, reference, threads)
     with gzip.open(output + ".gz", "wt") if gz else open(output, "wt") as out:
         out.write(",".join([
             "ref",
@@ -147,7 +154,7 @@ def run_RNA_MaP(input_file, output, del_thred, insertion_thred, all, gz):
                 # input()
             
             for i in range(len(mutCountF)):
-                if not args.all and str(coverageF[i]) == "0" and str(coverageR[i]) == "0":
+                if not all and str(coverageF[i]) == "0" and str(coverageR[i]) == "0":
                     continue
                 out.write(",".join([
                     tgeno["SN"],
@@ -167,7 +174,7 @@ def run_RNA_MaP(input_file, output, del_thred, insertion_thred, all, gz):
 def run_DNA_MaP(input_file, output):
     pass
 
-def check_bam(input_file):
+def check_bam(input_file, reference=None):
     import os,sys
 
     # Check if file exists
@@ -177,27 +184,37 @@ def check_bam(input_file):
     else:
         logging.info(f"Found input file {input_file}")
 
-    # Check if file is BAM format 
-    if not input_file.endswith('.bam'):
-        logging.error(f"Input file {input_file} is not a BAM file")
-        sys.exit(1)
+    # Check if file is BAM or CRAM format 
+    if input_file.endswith('.bam'):
+        file_format, index_suffix = "BAM", ".bai"
+    elif input_file.endswith('.cram'):
+        file_format, index_suffix = "CRAM", ".crai"
     else:
-        logging.info("Input file is in BAM format")
+        logging.error(f"Input file {input_file} is not a BAM or CRAM file")
+        sys.exit(1)
+    logging.info(f"Input file is in {file_format} format")
         
-    # Check if BAM index exists
-    if not os.path.exists(input_file + '.bai'):
-        logging.error(f"BAM index file {input_file}.bai does not exist. Please index the BAM file first")
+    # Check if the index exists
+    if not os.path.exists(input_file + index_suffix):
+        logging.error(f"{file_format} index file {input_file}{index_suffix} does not exist. Please index the {file_format} file first")
         sys.exit(1)
     else:
-        logging.info("Found BAM index file")
+        logging.info(f"Found {file_format} index file")
+
+    # CRAM sequences are rebuilt from the reference
+    if reference is not None and not os.path.exists(reference):
+        logging.error(f"Reference file {reference} does not exist")
+        sys.exit(1)
+    if file_format == "CRAM" and reference is None and not os.environ.get('REF_PATH'):
+        logging.warning("No --reference given for CRAM input, htslib will look the reference up by MD5")
 
     return True
 
 
-def testMaP(input_file, dna):
+def testMaP(input_file, dna, reference=None, threads=1):
     import pysam
     limit=10000
-    bamfile = pysam.AlignmentFile(input_file, "rb")
+    bamfile = open_alignment(input_file, reference, threads)
     logging.info("First 5 references in BAM header:")
     for i, sq in enumerate(bamfile.header["SQ"][:5]):
         logging.info(f"  {sq['SN']}: {sq['LN']:,} bp")
@@ -262,16 +279,16 @@ def testMaP(input_file, dna):
 
 def run(args):
     logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
-    check_bam(args.input_bam)
+    check_bam(args.input_bam, args.reference)
     if args.output is None:
         args.output = os.path.basename(args.input_bam) + ".AtlasMaP"
     if args.test:
-        testMaP(args.input_bam, args.dna)
+        testMaP(args.input_bam, args.dna, args.reference, args.io_threads)
     else:
         if args.dna:
             run_DNA_MaP(args.input_bam, args.output)
         else:
-            run_RNA_MaP(args.input_bam, args.output, args.del_thred, args.insertion_thred, args.all, args.gz)
+            run_RNA_MaP(args.input_bam, args.output, args.del_thred, args.insertion_thred, args.all, args.gz, args.reference, args.io_threads)
 
 if __name__ == "__main__":
 
@@ -295,10 +312,11 @@ if __name__ == "__main__":
     description_text = '''{} 
 This module is used to process DMS-MaP, SHAPE-MaP output to complete the 
 first step after mapping, that is, to obtain mutation, insertion, deletion 
-information. Process BAM files and output into AtlasMaP format.'''.format(logo)
+information. Process BAM or CRAM files and output into AtlasMaP format.'''.format(logo)
 
     parser = argparse.ArgumentParser(description=description_text, formatter_class=argparse.RawTextHelpFormatter)
-    parser.add_argument('input_bam', type=str, help='Path to the input indexed BAM file.')
+    parser.add_argument('input_bam', type=str, help='Path to the input indexed BAM or CRAM file.')
+    parser.add_argument('-r', '--reference', type=str, default=None, help='Reference FASTA the CRAM file was encoded against')
     parser.add_argument('--dna', action='store_true', help='DNA model or RNA model, default is RNA model', default=False)
     parser.add_argument('--test', action='store_true', help='test mode, default is False', default=False)
     parser.add_argument('-o', '--output', type=str, default=None, help='output file name, default is input_file.AtlasMaP')
@@ -306,6 +324,7 @@ information. Process BAM files and output into AtlasMaP format.'''.format(logo)
     parser.add_argument('-it', '--insertion_thred', type=int, default=5, help='Insertions longer than this threshold will be ignored (default: 5)')
     parser.add_argument('--all', action='store_true', help='output position with no coverage, default is False', default=False)
     parser.add_argument('-gz', action='store_true', help='output gzipped file, default is False', default=False)
+    parser.add_argument('--io-threads', type=int, default=1, help='threads decompressing the input file, default is 1')
 
     args = parser.parse_args()
     run(args)
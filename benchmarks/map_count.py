@@ -0,0 +1,362 @@
+"""Regression and benchmark harness for atlas_MaP_count
+
+Builds synthetic BAMs with known mismatches, deletions and insertions (MD
+tags, soft clips, both strands, single and paired end), runs
+``run_RNA_MaP`` on them in a fresh interpreter and checks the AtlasMaP
+output line by line against the output expected from the simulated
+truth. Reads/s and peak RSS are reported for every read length and depth,
+so each change to the counter can be checked for correctness and speed.
+
+    python -m benchmarks.map_count
+    python -m benchmarks.map_count --read-lengths 150 --depths 20,200 --json map.json
+    python -m benchmarks.map_count --read-lengths 150 --depths 500 --io-threads 1,4
+
+Exits with status 1 when any output differs from the expected one.
+"""
+import argparse
+import difflib
+import gzip
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parent.parent
+BASES = 'ACGT'
+
+# Runs the counter in its own process and reports time and peak RSS
+RUNNER = f"""
+import json, resource, sys, time
+sys.path.insert(0, {str(REPO)!r})
+from atlas_MaP_count import run_RNA_MaP
+args = json.loads(sys.argv[1])
+start = time.perf_counter()
+run_RNA_MaP(**args)
+seconds = time.perf_counter() - start
+try:
+    # ru_maxrss survives exec on Linux and would include the parent's peak
+    with open('/proc/self/status') as f:
+        max_rss = next(int(line.split()[1]) for line in f if line.startswith('VmHWM')) * 2 ** 10
+except OSError:
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    max_rss *= 1 if sys.platform == 'darwin' else 2 ** 10
+print(json.dumps({{'seconds': seconds, 'max_rss_mib': max_rss / 2 ** 20}}))
+"""
+
+
+class Truth:
+    """Expected AtlasMaP counts for one reference, filled while simulating"""
+
+    def __init__(self, name, length, reverse_insertions_in_f=True):
+        """
+        Args:
+            reverse_insertions_in_f (bool): Expect reverse-strand insertions
+                in the F columns. This is a known discrepancy of
+                run_RNA_MaP, which only fills insInfoF; the default keeps
+                the harness checking the counter as it stands, False expects
+                the per-strand counts a fixed counter would write
+        """
+        self.name = name
+        self.length = length
+        self.reverse_insertions_in_f = reverse_insertions_in_f
+        # Per strand ('F'/'R'): coverage, mismatch, deletion and insertion lists by position
+        self.coverage = {'F': {}, 'R': {}}
+        self.mut = {'F': {}, 'R': {}}
+        self.dels = {'F': {}, 'R': {}}
+        self.ins = {'F': {}, 'R': {}}
+
+    def add_read(self, events, strand, del_thred, insertion_thred):
+        """Apply one read's events the way run_RNA_MaP counts them"""
+        coverage = self.coverage[strand]
+        for event in events:
+            kind, pos = event[0], event[1]
+            if kind == 'match':
+                coverage[pos] = coverage.get(pos, 0) + 1
+            elif kind == 'mismatch':
+                coverage[pos] = coverage.get(pos, 0) + 1
+                self.mut[strand].setdefault(pos, []).append(f"{event[2]}->{event[3]}")
+            elif kind == 'deletion':
+                # Counted at the last deleted base, and only up to del_thred
+                if len(event[2]) <= del_thred:
+                    coverage[pos] = coverage.get(pos, 0) + 1
+                    self.dels[strand].setdefault(pos, []).append(event[2])
+            elif kind == 'insertion':
+                # Anchored on the base before it
+                if len(event[2]) - 1 <= insertion_thred:
+                    ins_strand = 'F' if self.reverse_insertions_in_f else strand
+                    self.ins[ins_strand].setdefault(pos, []).append(event[2])
+
+    def lines(self, all_positions=False):
+        for i in range(self.length + 1):
+            cov_f = self.coverage['F'].get(i, 0)
+            cov_r = self.coverage['R'].get(i, 0)
+            if not all_positions and cov_f == 0 and cov_r == 0:
+                continue
+            fields = [self.name, str(i + 1)]
+            for strand, coverage in (('F', cov_f), ('R', cov_r)):
+                fields.append(str(coverage))
+                for table in (self.mut, self.dels, self.ins):
+                    items = table[strand].get(i)
+                    fields.append(f"{len(items)}:{';'.join(items)}" if items else '0')
+            yield ','.join(fields)
+
+
+def simulate_alignment(rng, ref, start, read_length, error_rate, del_max, ins_max, clip_max):
+    """Simulate one aligned read starting at ``start`` on ``ref``
+
+    Events are kept at least two aligned bases apart and away from the read
+    ends, so every one of them is unambiguous in the CIGAR and MD tag.
+
+    Returns:
+        tuple: (cigartuples, query sequence, MD tag, events) where events are
+            ('match', pos), ('mismatch', pos, ref_base, read_base),
+            ('deletion', last_deleted_pos, bases) and
+            ('insertion', anchor_pos, bases) in 0-based reference positions
+    """
+    cigar = []
+    query = []
+    md = []
+    md_run = 0
+    events = []
+
+    def add(op, length):
+        if cigar and cigar[-1][0] == op:
+            cigar[-1] = (op, cigar[-1][1] + length)
+        else:
+            cigar.append((op, length))
+
+    left_clip = rng.randint(1, clip_max) if clip_max and rng.random() < 0.3 else 0
+    if left_clip:
+        add(4, left_clip)
+        query.extend(rng.choices(BASES, k=left_clip))
+
+    ref_pos = start
+    aligned = 0
+    since_event = 0
+    while aligned < read_length:
+        roll = rng.random() if 2 <= aligned < read_length - 3 and since_event >= 2 else 1.0
+        if roll < error_rate / 3:
+            ref_base = ref[ref_pos]
+            read_base = rng.choice([b for b in BASES if b != ref_base])
+            add(0, 1)
+            query.append(read_base)
+            md.append(f"{md_run}{ref_base}")
+            md_run = 0
+            events.append(('mismatch', ref_pos, ref_base, read_base))
+            ref_pos += 1
+            aligned += 1
+            since_event = 0
+        elif roll < 2 * error_rate / 3:
+            length = rng.randint(1, del_max)
+            deleted = ref[ref_pos:ref_pos + length]
+            add(2, length)
+            md.append(f"{md_run}^{deleted}")
+            md_run = 0
+            events.append(('deletion', ref_pos + length - 1, deleted))
+            ref_pos += length
+            since_event = 0
+        elif roll < error_rate:
+            length = rng.randint(1, ins_max)
+            inserted = ''.join(rng.choices(BASES, k=length))
+            add(1, length)
+            query.extend(inserted)
+            events.append(('insertion', ref_pos - 1, inserted))
+            aligned += length
+            since_event = 0
+        else:
+            add(0, 1)
+            query.append(ref[ref_pos])
+            md_run += 1
+            events.append(('match', ref_pos))
+            ref_pos += 1
+            aligned += 1
+            since_event += 1
+    md.append(str(md_run))
+
+    right_clip = rng.randint(1, clip_max) if clip_max and rng.random() < 0.3 else 0
+    if right_clip:
+        add(4, right_clip)
+        query.extend(rng.choices(BASES, k=right_clip))
+
+    return cigar, ''.join(query), ''.join(md), events
+
+
+def make_map_bam(bam_path, references, read_length, depth, paired=True, error_rate=0.03,
+                 del_thred=5, insertion_thred=5, clip_max=5, seed=0, reverse_insertions_in_f=True):
+    """Write a sorted, indexed MaP BAM and return the expected counts
+
+    Args:
+        references (dict): Reference name -> length
+        depth (float): Mean read depth per reference
+        paired (bool): Simulate read pairs (both orientations) instead of
+            single-end reads on random strands
+        reverse_insertions_in_f (bool): See Truth
+
+    Returns:
+        tuple: (list of Truth in header order, number of reads written)
+    """
+    import pysam
+
+    rng = random.Random(seed)
+    # Deletions and insertions up to two bases past the thresholds, so both
+    # sides of each threshold are exercised
+    del_max = del_thred + 2
+    ins_max = insertion_thred + 3
+    margin = read_length * 2 + del_max * read_length
+
+    header = {'HD': {'VN': '1.6', 'SO': 'coordinate'},
+              'SQ': [{'SN': name, 'LN': length} for name, length in references.items()]}
+    truths = []
+    written = 0
+
+    with pysam.AlignmentFile(bam_path, 'wb', header=header) as bam:
+        for ref_id, (name, length) in enumerate(references.items()):
+            ref = ''.join(rng.choices(BASES, k=length))
+            truth = Truth(name, length, reverse_insertions_in_f)
+            truths.append(truth)
+
+            reads = []
+            fragments = max(1, int(depth * length / read_length / (2 if paired else 1)))
+            for fragment in range(fragments):
+                start = rng.randrange(0, length - margin)
+                if paired:
+                    mate_start = start + rng.randint(0, read_length)
+                    r1_reverse = rng.random() < 0.5
+                    mates = [(start, True, r1_reverse), (mate_start, False, not r1_reverse)]
+                else:
+                    mates = [(start, None, rng.random() < 0.5)]
+
+                segments = []
+                for mate_start_, is_read1, is_reverse in mates:
+                    cigar, sequence, md, events = simulate_alignment(
+                        rng, ref, mate_start_, read_length, error_rate, del_max, ins_max, clip_max)
+                    read = pysam.AlignedSegment()
+                    read.query_name = f'{name}_frag{fragment}'
+                    read.reference_id = ref_id
+                    read.reference_start = mate_start_
+                    read.is_reverse = is_reverse
+                    if is_read1 is not None:
+                        read.is_paired = True
+                        read.is_proper_pair = True
+                        read.is_read1 = is_read1
+                        read.is_read2 = not is_read1
+                    read.query_sequence = sequence
+                    read.query_qualities = pysam.qualitystring_to_array('I' * len(sequence))
+                    read.cigartuples = cigar
+                    read.mapping_quality = 60
+                    read.set_tag('MD', md)
+                    segments.append((read, events))
+
+                if paired:
+                    for (read, _), (mate, _) in zip(segments, segments[::-1]):
+                        read.next_reference_id = ref_id
+                        read.next_reference_start = mate.reference_start
+                        read.mate_is_reverse = mate.is_reverse
+                reads.extend(segments)
+
+            # Written, fetched and counted in coordinate order
+            reads.sort(key=lambda item: item[0].reference_start)
+            for read, events in reads:
+                strand = 'F' if read.is_read1 != read.is_reverse else 'R'
+                truth.add_read(events, strand, del_thred, insertion_thred)
+                bam.write(read)
+            written += len(reads)
+
+    pysam.index(bam_path)
+    return truths, written
+
+
+def run_counter(bam_path, output, del_thred, insertion_thred, all_positions, gz, threads=1):
+    """Run run_RNA_MaP in a fresh interpreter, return its time and peak RSS"""
+    args = {'input_file': bam_path, 'output': output, 'del_thred': del_thred,
+            'insertion_thred': insertion_thred, 'all': all_positions, 'gz': gz,
+            'threads': threads}
+    proc = subprocess.run([sys.executable, '-c', RUNNER, json.dumps(args)],
+                          capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"run_RNA_MaP failed:\n{proc.stderr}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def check_output(output, gz, truths, all_positions):
+    """Compare the counter output with the expected lines, return a diff (empty if equal)"""
+    opener = gzip.open(output + '.gz', 'rt') if gz else open(output)
+    with opener as f:
+        actual = f.read().splitlines()
+    expected = ['ref,pos,coverageF,mutF,delF,insF,coverageR,mutR,delR,insR']
+    for truth in truths:
+        expected.extend(truth.lines(all_positions))
+    if actual == expected:
+        return []
+    return list(difflib.unified_diff(expected, actual, 'expected', 'actual', lineterm='', n=1))[:40]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--read-lengths', default='50,150,300', help='Comma-separated read lengths')
+    parser.add_argument('--depths', default='10,50', help='Comma-separated mean depths')
+    parser.add_argument('--ref-length', type=int, default=20000, help='Length of each of the two references')
+    parser.add_argument('--error-rate', type=float, default=0.03)
+    parser.add_argument('--single-end', action='store_true', help='Simulate single-end instead of paired reads')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--insertions-by-strand', action='store_true',
+                        help='Expect reverse-strand insertions in the R columns; by default they are '
+                             'expected in the F columns, where run_RNA_MaP currently writes them')
+    parser.add_argument('--io-threads', default='1',
+                        help='Comma-separated htslib decompression thread counts each case is run with')
+    parser.add_argument('--json', dest='json_path', help='Write results to this JSON file')
+    parser.add_argument('--keep', help='Keep generated BAMs and outputs in this directory')
+    args = parser.parse_args()
+
+    references = {'rnaA': args.ref_length, 'rnaB': args.ref_length // 2}
+    read_lengths = [int(value) for value in args.read_lengths.split(',')]
+    depths = [float(value) for value in args.depths.split(',')]
+    io_threads = [int(value) for value in args.io_threads.split(',')]
+
+    # (read length, depth, del_thred, insertion_thred, all, gz); the default
+    # thresholds are timed, the extra cases only check the other code paths
+    cases = [(length, depth, 5, 5, False, False) for length in read_lengths for depth in depths]
+    cases.append((read_lengths[0], depths[0], 1, 0, True, True))
+
+    results = []
+    failed = False
+    print(f"{'length':>7}{'depth':>7}{'thresholds':>12}{'threads':>8}{'reads':>9}{'seconds':>10}{'reads/s':>10}"
+          f"{'peak RSS MiB':>14}  output")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        out_dir = args.keep or tmp_dir
+        os.makedirs(out_dir, exist_ok=True)
+        for i, (length, depth, del_thred, insertion_thred, all_positions, gz) in enumerate(cases):
+            bam_path = os.path.join(out_dir, f'map_{length}_{depth:g}_{i}.bam')
+            truths, reads = make_map_bam(
+                bam_path, references, length, depth, paired=not args.single_end,
+                error_rate=args.error_rate, del_thred=del_thred,
+                insertion_thred=insertion_thred, seed=args.seed + i,
+                reverse_insertions_in_f=not args.insertions_by_strand)
+            for threads in io_threads:
+                output = os.path.join(out_dir, f'map_{length}_{depth:g}_{i}_t{threads}.AtlasMaP')
+                timing = run_counter(bam_path, output, del_thred, insertion_thred, all_positions, gz, threads)
+                diff = check_output(output, gz, truths, all_positions)
+                failed |= bool(diff)
+
+                result = dict(timing, read_length=length, depth=depth, reads=reads, del_thred=del_thred,
+                              insertion_thred=insertion_thred, all=all_positions, gz=gz, threads=threads,
+                              reads_per_second=reads / timing['seconds'], ok=not diff)
+                results.append(result)
+                print(f"{length:>7}{depth:>7g}{f'{del_thred}/{insertion_thred}':>12}{threads:>8}{reads:>9}"
+                      f"{timing['seconds']:>10.3f}{result['reads_per_second']:>10.0f}"
+                      f"{timing['max_rss_mib']:>14.1f}  {'ok' if not diff else 'DIFFERS'}")
+                if diff:
+                    print('\n'.join(diff))
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump({'python': sys.version.split()[0], 'cases': results}, f, indent=2)
+        print(f"Results written to {args.json_path}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
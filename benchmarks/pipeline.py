@@ -0,0 +1,231 @@
+"""Snapshot pipeline benchmark
+
+Generates synthetic BAMs (see benchmarks/synthetic.py) and times each stage
+of a render separately: BAM fetch, find_exon_blocks, read collection,
+row packing, track layout and SVG/PNG/PDF serialisation. Throughput and
+the process's peak resident memory per stage (pysam/htslib and NumPy
+buffers included) are reported as a table and, with --json, written out
+for regression tracking.
+
+    python -m benchmarks.pipeline
+    python -m benchmarks.pipeline --profile short --reads 50000 --json results.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from .synthetic import PROFILES, make_profile_bam
+
+SRC = Path(__file__).resolve().parent.parent / 'src'
+sys.path.insert(0, str(SRC))
+
+FORMATS = ('svg', 'png', 'pdf')
+
+
+def reset_peak_rss():
+    """Lower the process's peak RSS (VmHWM) to its current RSS, if Linux allows it"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss():
+    """Peak resident memory of the process in bytes"""
+    try:
+        with open('/proc/self/status') as f:
+            return next(int(line.split()[1]) for line in f if line.startswith('VmHWM')) * 2 ** 10
+    except (OSError, StopIteration):
+        import resource
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss * (1 if sys.platform == 'darwin' else 2 ** 10)
+
+
+def measure(func, runs):
+    """Time func over runs and record the peak resident memory meanwhile
+
+    The peak covers everything the process holds while the stage runs,
+    including its inputs. Where it cannot be reset (not Linux) it is the
+    peak since the process started, so it never decreases from one stage
+    to the next.
+
+    Returns:
+        dict: median/min seconds, peak RSS MiB and whether that peak was
+            reset for this stage
+    """
+    reset = reset_peak_rss()
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return {
+        'seconds': statistics.median(times),
+        'min_seconds': min(times),
+        'peak_rss_mib': peak_rss() / 2 ** 20,
+        'peak_rss_per_stage': reset,
+    }
+
+
+def make_renderer(chrom, start, end, image_width):
+    """VectorRenderer wired to the coordinate system, as in render_alignment_snapshot"""
+    from nanostructure.config import COLORS
+    from nanostructure.utils.coordinates.drawing_coordinates import DrawingCoordinates
+    from nanostructure.utils.coordinates.scale import XScale
+    from nanostructure.utils.renderers.vector_renderer import VectorRenderer
+
+    coord = DrawingCoordinates(width=image_width, height=50)
+    coord.chrom = chrom
+    coord.start_pos = start
+    coord.end_pos = end
+    coord.xscale = XScale(start, end, image_width)
+    renderer = VectorRenderer(COLORS, image_width)
+    renderer.coordinates = coord
+    coord.renderer = renderer
+    return renderer
+
+
+def bench_profile(bam_path, chrom, start, end, runs, image_width, max_reads, formats, out_dir):
+    """Time every pipeline stage on one BAM region
+
+    Returns:
+        dict: stage name -> measure() result, plus 'items' processed
+    """
+    import pysam
+    from nanostructure.utils.alignment_utils import collect_read_alignments, find_exon_blocks
+    from nanostructure.utils.coordinate_utils import assign_track_rows
+
+    stages = {}
+
+    def fetch():
+        with pysam.AlignmentFile(bam_path, 'rb') as bam:
+            return list(bam.fetch(chrom, start, end))
+
+    reads = fetch()
+    stages['fetch'] = dict(measure(fetch, runs), items=len(reads))
+
+    def exon_blocks():
+        for read in reads:
+            find_exon_blocks(read)
+    stages['find_exon_blocks'] = dict(measure(exon_blocks, runs), items=len(reads))
+
+    def collect():
+        return collect_read_alignments(bam_path, chrom, start, end, image_width,
+                                       max_reads=max_reads, method='continuous')
+
+    forward_tracks, reverse_tracks = collect()
+    stages['collect'] = dict(measure(collect, runs), items=len(reads))
+
+    tracks = forward_tracks + reverse_tracks
+
+    def pack():
+        assign_track_rows(forward_tracks)
+        assign_track_rows(reverse_tracks)
+    stages['pack'] = dict(measure(pack, runs), items=len(tracks))
+
+    forward_tracks.sort(key=lambda x: (x.x_start, (x.x_end - x.x_start)))
+    reverse_tracks.sort(key=lambda x: (x.x_start, (x.x_end - x.x_start)))
+
+    renderer = make_renderer(chrom, start, end, image_width)
+
+    def layout():
+        renderer._layout_tracks(forward_tracks, reverse_tracks)
+    stages['layout'] = dict(measure(layout, runs), items=len(tracks))
+
+    panel = {'label': None, 'forward': forward_tracks, 'reverse': reverse_tracks, 'coverage': None}
+    for fmt in formats:
+        output_path = os.path.join(out_dir, f'bench.{fmt}')
+
+        def serialise():
+            make_renderer(chrom, start, end, image_width).render_panels([panel], output_path, 'benchmark')
+        try:
+            result = measure(serialise, runs)
+        except ImportError as e:  # PNG/PDF without cairosvg
+            stages[f'render_{fmt}'] = {'skipped': str(e)}
+            continue
+        result['output_bytes'] = os.path.getsize(output_path)
+        stages[f'render_{fmt}'] = dict(result, items=len(tracks))
+
+    for result in stages.values():
+        if 'items' in result and result['seconds'] > 0:
+            result['items_per_second'] = result['items'] / result['seconds']
+    return stages
+
+
+def print_table(name, stages):
+    print(f"\n{name}")
+    print(f"{'stage':<18}{'items':>9}{'median s':>11}{'min s':>10}{'items/s':>12}{'peak RSS MiB':>14}")
+    for stage, result in stages.items():
+        if 'skipped' in result:
+            print(f"{stage:<18}  skipped: {result['skipped'].splitlines()[0]}")
+            continue
+        print(f"{stage:<18}{result['items']:>9}{result['seconds']:>11.4f}{result['min_seconds']:>10.4f}"
+              f"{result.get('items_per_second', 0):>12.0f}{result['peak_rss_mib']:>14.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--profile', choices=sorted(PROFILES), action='append',
+                        help='Read profile to benchmark, repeatable (default: all)')
+    parser.add_argument('--reads', type=int, help='Override the profile read count')
+    parser.add_argument('--error-rate', type=float, help='Override the profile error rate')
+    parser.add_argument('--runs', type=int, default=3, help='Timed runs per stage')
+    parser.add_argument('--image-width', type=int, default=1000)
+    parser.add_argument('--max-reads', type=int, default=100)
+    parser.add_argument('--formats', default=','.join(FORMATS),
+                        help='Comma-separated output formats to time')
+    parser.add_argument('--json', dest='json_path', help='Write results to this JSON file')
+    parser.add_argument('--keep', help='Keep generated BAMs and outputs in this directory')
+    args = parser.parse_args()
+
+    import pysam
+
+    formats = [fmt for fmt in args.formats.split(',') if fmt]
+    results = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'pysam': pysam.__version__,
+            'platform': platform.platform(),
+            'runs': args.runs,
+            'image_width': args.image_width,
+        },
+        'profiles': {},
+    }
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        out_dir = args.keep or tmp_dir
+        os.makedirs(out_dir, exist_ok=True)
+        for profile in args.profile or sorted(PROFILES):
+            params = dict(PROFILES[profile])
+            if args.reads:
+                params['reads'] = args.reads
+            if args.error_rate is not None:
+                params['error_rate'] = args.error_rate
+
+            bam_path = os.path.join(out_dir, f'{profile}.bam')
+            make_profile_bam(bam_path, profile, **params)
+            start = 1000
+            end = start + params['region_length']
+
+            stages = bench_profile(bam_path, 'chr1', start, end, args.runs, args.image_width,
+                                   args.max_reads, formats, out_dir)
+            results['profiles'][profile] = {'params': params, 'stages': stages}
+            print_table(f"{profile} ({params['reads']} reads)", stages)
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.json_path}")
+
+
+if __name__ == '__main__':
+    main()
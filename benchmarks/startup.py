@@ -0,0 +1,111 @@
+"""CLI start-up benchmark
+
+Measures time to first byte of ``nanostructure --help`` and the wall time
+of a minimal SVG render, each in a fresh interpreter, and reports which
+heavy dependencies were imported along the way.
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --runs 20 --bam sample.bam --region chr1:1000-2000
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SRC = Path(__file__).resolve().parent.parent / 'src'
+HEAVY_MODULES = ('pysam', 'svgwrite', 'cairosvg', 'cairocffi', 'PIL', 'numpy')
+
+# Runs the CLI and reports the heavy modules loaded by the time it exits
+RUNNER = f"""
+import atexit, sys
+atexit.register(lambda: sys.stderr.write(
+    'loaded:' + ','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules) + '\\n'))
+from nanostructure.cli import main
+main()
+"""
+
+
+def make_bam(directory, reads=50, length=100):
+    """Write a small sorted and indexed BAM with evenly spaced reads on chr1"""
+    import pysam
+
+    bam_path = os.path.join(directory, 'startup.bam')
+    header = {'HD': {'VN': '1.6', 'SO': 'coordinate'}, 'SQ': [{'SN': 'chr1', 'LN': 100000}]}
+    with pysam.AlignmentFile(bam_path, 'wb', header=header) as bam:
+        for i in range(reads):
+            read = pysam.AlignedSegment()
+            read.query_name = f'read{i}'
+            read.reference_id = 0
+            read.reference_start = 1000 + i * 20
+            read.is_reverse = bool(i % 2)
+            read.query_sequence = 'A' * length
+            read.cigartuples = [(0, length)]
+            read.mapping_quality = 60
+            read.set_tag('MD', str(length))
+            bam.write(read)
+    pysam.index(bam_path)
+    return bam_path
+
+
+def run_cli(args, to_stdout=True):
+    """Run the CLI once, return (seconds to first stdout byte, seconds to exit, loaded modules)
+
+    Renders write their file just before exiting, so for them only the exit
+    time is measured (first byte is None).
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(SRC), os.environ.get('PYTHONPATH')])))
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, '-c', RUNNER] + args, env=env,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    first_byte = None
+    if to_stdout and proc.stdout.read(1):
+        first_byte = time.perf_counter() - start
+    stdout, stderr = proc.communicate()
+    elapsed = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(f"nanostructure {' '.join(args)} failed:\n{stderr.decode()}")
+
+    loaded = ''
+    for line in stderr.decode().splitlines():
+        if line.startswith('loaded:'):
+            loaded = line[len('loaded:'):]
+    return first_byte, elapsed, loaded
+
+
+def report(name, samples):
+    first_bytes = [s[0] for s in samples if s[0] is not None]
+    elapsed = [s[1] for s in samples]
+    ttfb = f"{statistics.median(first_bytes) * 1000:8.1f}" if first_bytes else '       -'
+    print(f"{name:<16}{ttfb} {statistics.median(elapsed) * 1000:8.1f} "
+          f"{min(elapsed) * 1000:8.1f}   {samples[-1][2] or '-'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--runs', type=int, default=10, help='Runs per command')
+    parser.add_argument('--bam', help='BAM for the render benchmark (default: generated)')
+    parser.add_argument('--region', default='chr1:1000-2000', help='Region to render')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        bam_path = args.bam or make_bam(tmp_dir)
+        output_path = os.path.join(tmp_dir, 'startup.svg')
+        commands = {
+            '--help': ['--help'],
+            'render --help': ['render', '--help'],
+            'render svg': ['-b', bam_path, '-p', args.region, '-o', output_path],
+        }
+
+        print(f"{'command':<16}{'ttfb ms':>8} {'median':>8} {'min':>8}   heavy modules loaded")
+        for name, cli_args in commands.items():
+            to_stdout = '--help' in cli_args
+            run_cli(cli_args, to_stdout)  # warm the OS file cache
+            report(name, [run_cli(cli_args, to_stdout) for _ in range(args.runs)])
+
+
+if __name__ == '__main__':
+    main()
@@ -8,7 +8,11 @@ Description  :
 '''
 
 
-import matplotlib.patches as mp
+import heapq
+import os
+import threading
+
+from matplotlib.collections import PolyCollection
 import matplotlib.pyplot as plt
 import matplotlib.ticker as ticker
 import numpy as np
@@ -47,6 +51,7 @@ def plot_gene_model(ax, gene_models, fig_start, fig_end, gene_color='k', y_space
     ylim = 0  # ax ylim的下限
     height = 3 # gene model 高度
     y_space = y_space+height*2
+    rects = []  # (x, y, width, height) of every line/UTR/exon, drawn as one collection
     for gene_model in gene_models.values:
         chrom, chromStart, chromEnd, gene_id, _, strand, thickStart, thickEnd, _, blockCount, blockSizes, blockStarts, y_pos = gene_model
         y_pos = -y_space*y_pos
@@ -68,53 +73,44 @@ def plot_gene_model(ax, gene_models, fig_start, fig_end, gene_color='k', y_space
         else:
             ax.annotate('', xy=(chromEnd-small_relative, height*2+y_pos), xytext=(chromEnd, y_pos), arrowprops=arrowprops)
         
-        line = mp.Rectangle((chromStart, y_pos-height/8), chromEnd-chromStart, height/4, color=gene_color, linewidth=0) # 基因有多长这条线就有多长
-        ax.add_patch(line)
+        rects.append((chromStart, y_pos-height/8, chromEnd-chromStart, height/4)) # 基因有多长这条线就有多长
 
         for exonstart, size in zip(blockStarts, blockSizes):
             if exonstart == chromStart and exonstart+size == chromEnd:
                 utr_size = thickStart-chromStart
-                utr = mp.Rectangle((exonstart, y_pos-height/2), utr_size, height, color=gene_color, linewidth=0)
-                ax.add_patch(utr)
+                rects.append((exonstart, y_pos-height/2, utr_size, height))
                 utr_size = chromEnd-thickEnd
-                utr = mp.Rectangle((thickEnd, y_pos-height/2), utr_size, height, color=gene_color, linewidth=0)
-                ax.add_patch(utr)
-                exon = mp.Rectangle((thickStart, y_pos-height), thickEnd-thickStart, height*2, color=gene_color, linewidth=0)
-                ax.add_patch(exon)
+                rects.append((thickEnd, y_pos-height/2, utr_size, height))
+                rects.append((thickStart, y_pos-height, thickEnd-thickStart, height*2))
 
             elif exonstart + size <= thickStart:
                 # 只有5'/ 3'UTR
-                utr = mp.Rectangle((exonstart, y_pos-height/2), size, height, color=gene_color, linewidth=0)
-                ax.add_patch(utr)
+                rects.append((exonstart, y_pos-height/2, size, height))
 
             elif exonstart < thickStart and exonstart + size > thickStart:
                 # 带有5' / 3' UTR的exon
                 utr_size = thickStart-exonstart
-                utr = mp.Rectangle((exonstart, y_pos-height/2), utr_size, height, color=gene_color, linewidth=0)
-                exon = mp.Rectangle((exonstart+utr_size, y_pos-height), size-utr_size, height*2, color=gene_color, linewidth=0)
-                ax.add_patch(utr)
-                ax.add_patch(exon)
+                rects.append((exonstart, y_pos-height/2, utr_size, height))
+                rects.append((exonstart+utr_size, y_pos-height, size-utr_size, height*2))
 
             elif exonstart >= thickStart and exonstart + size <= thickEnd:
                 # 普通exon
-                exon = mp.Rectangle((exonstart, y_pos-height), size, height*2, color=gene_color, linewidth=0)
-                ax.add_patch(exon)
+                rects.append((exonstart, y_pos-height, size, height*2))
 
             elif exonstart < thickEnd and exonstart + size > thickEnd:
                 # 带有3' / 5' UTR的exon
                 utr_size = exonstart + size - thickEnd
-                utr = mp.Rectangle((thickEnd, y_pos-height/2), utr_size, height, color=gene_color, linewidth=0)
-                exon = mp.Rectangle((exonstart, y_pos-height), size-utr_size, height*2, color=gene_color, linewidth=0)
-                ax.add_patch(utr)
-                ax.add_patch(exon)
+                rects.append((thickEnd, y_pos-height/2, utr_size, height))
+                rects.append((exonstart, y_pos-height, size-utr_size, height*2))
 
             elif exonstart >= thickEnd:
                 # 只有3'/ 5'UTR
-                utr = mp.Rectangle((exonstart, y_pos-height/2), size, height, color=gene_color, linewidth=0)
-                ax.add_patch(utr)
+                rects.append((exonstart, y_pos-height/2, size, height))
 
 
         ax.annotate(gene_id, xy=((chromStart+chromEnd)/2, y_pos+height*1.5), ha='center')
+
+    add_rectangles(ax, rects, gene_color)
     
     # set ax
     ax.spines['right'].set_visible(False)
@@ -153,7 +149,7 @@ def get_gene_model(chrom, start, end, bed_path):
             rgb blockCount              blockSizes                blockStarts
               0          6  361,196,73,50,114,372,  0,527,823,1802,1952,2152,
     """    
-    tbx = pysam.TabixFile(bed_path)
+    tbx = get_tabix(bed_path)
     gene_models = pd.DataFrame(
         [gene_model.split('\t') for gene_model in tbx.fetch(chrom, start, end)],
         columns = ['chrom', 'start', 'end', 'gene_id', 'score', 'strand', 'thickStart', 'thickEnd', 'rgb', 'blockCount', 'blockSizes', 'blockStarts']
@@ -167,6 +163,77 @@ def get_gene_model(chrom, start, end, bed_path):
 # other function
 ######
 
+# open pysam.TabixFile handles of each thread, see get_tabix
+_tabix_local = threading.local()
+
+
+def _reset_tabix_handles():
+    # a forked child starts without the parent's handles
+    global _tabix_local
+    _tabix_local = threading.local()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_tabix_handles)
+
+
+def get_tabix(path):
+    """Return a cached pysam.TabixFile for path.
+
+    Loading a tabix index is the slow part of a small region query, so
+    handles are kept open and shared by every IGV object and batch loop.
+    Each thread keeps its own handles, which are dropped when the thread
+    ends or the process forks, and a handle is reopened when the file
+    changes on disk. See close_tabix_handles.
+
+    Args:
+        path (str): the PATH of the bgzipped and tabix indexed file.
+
+    Returns:
+        pysam.TabixFile
+    """
+    stat = os.stat(path)
+    key = os.path.abspath(path)
+    version = (stat.st_size, stat.st_mtime_ns)
+
+    handles = _tabix_local.__dict__.setdefault('handles', {})
+    entry = handles.get(key)
+    if entry is None or entry[0] != version:
+        if entry is not None:
+            entry[1].close()
+        entry = (version, pysam.TabixFile(path))
+        handles[key] = entry
+    return entry[1]
+
+
+def close_tabix_handles():
+    """Close the tabix handles get_tabix opened in the calling thread."""
+    for _, tbx in _tabix_local.__dict__.pop('handles', {}).values():
+        tbx.close()
+
+
+def get_polya_sites(chrom, start, end, polya_site, gene_list=None):
+    """Get polyA site positions in the region.
+
+    Args:
+        polya_site (str): the PATH of the tabix indexed polyA site bed file,
+            name column as <gene_id>_<suffix>.
+
+        gene_list (set, optional): only keep sites of these genes.
+            Defaults to None.
+
+    Returns:
+        list: polyA site end coordinates.
+    """
+    sites = []
+    for item in get_tabix(polya_site).fetch(chrom, start, end):
+        chrom_, start_, end_, gene_id_, _, strand_, _ = item.split('\t')
+        gene_id_ = gene_id_.split('_')[0]
+        if gene_list is None or gene_id_ in gene_list:
+            sites.append(int(end_))
+    return sites
+
+
 def is_overlap(gene_a, gene_b, threshold=0):
     """To judge whether two region is overlap.
 
@@ -253,34 +320,77 @@ def get_y_pos_continuous(df, gene_list=None, threshold=0):
     Returns:
         int: item counts in the y position.
     """
-    # initialization of y_pos columns
-    df['y_pos'] = None
-
-    read_list = []
-    for index_id, item in enumerate(df.values):
-        chrom, start, end, gene_id, *_ = item
-        
-        # only plot reads/gene_model in the gene_list
-        if gene_list is not None and gene_id not in gene_list:
-            df.drop(index_id, inplace=True)
-            continue
-        
-        current_read = (chrom, start, end)
-        is_add_read = False
-        y_pos = -1
-        for y_pos in range(len(read_list)):
-            y_pos_read = read_list[y_pos]
-            if not is_overlap(current_read, y_pos_read, threshold=threshold):
-                read_list[y_pos] = current_read
-                df.at[index_id, 'y_pos'] = y_pos
-                is_add_read = True
-                break
-        if not is_add_read:
-            read_list.append(current_read)
-            y_pos += 1
-            df.at[index_id, 'y_pos'] = y_pos
+    # only plot reads/gene_model in the gene_list
+    if gene_list is not None:
+        keep = df['gene_id'].isin(gene_list).to_numpy()
+        if not keep.all():
+            df.drop(df.index[~keep], inplace=True)
+
+    y_pos, row_count = assign_rows(
+        df['start'].to_numpy().astype(np.int64),
+        df['end'].to_numpy().astype(np.int64),
+        threshold=threshold
+    )
+    df['y_pos'] = y_pos
             
-    return len(read_list)
+    return row_count
+
+
+def assign_rows(starts, ends, threshold=0):
+    """First-fit row of each region, in the given order.
+
+    A region goes to the first row whose last region does not overlap it
+    (see is_overlap). When the starts never decrease (or the ends never
+    increase, the '-' strand order) a row that is free stays free for all
+    later regions, so rows are kept in heaps instead of being rescanned for
+    every region. Other orders fall back to the row-by-row scan.
+
+    Args:
+        starts (np.ndarray): region starts.
+        ends (np.ndarray): region ends.
+        threshold (int, optional): the minimum space between two region. Defaults to 0.
+
+    Returns:
+        (np.ndarray, int): the row of each region and the number of rows.
+    """
+    y_pos = np.empty(len(starts), dtype=np.int64)
+    if len(starts) == 0:
+        return y_pos, 0
+
+    if np.all(starts[1:] >= starts[:-1]):
+        # a row is free once its last region ends before start - threshold
+        keys, limits = ends, starts - threshold
+    elif np.all(ends[1:] <= ends[:-1]):
+        # a row is free once its last region starts after end + threshold
+        keys, limits = -starts, -(ends + threshold)
+    else:
+        read_list = []
+        for i, current_read in enumerate(zip(starts.tolist(), ends.tolist())):
+            for row, row_read in enumerate(read_list):
+                if min(current_read[1], row_read[1]) - max(current_read[0], row_read[0]) < -threshold:
+                    break
+            else:
+                row = len(read_list)
+                read_list.append(None)
+            read_list[row] = current_read
+            y_pos[i] = row
+        return y_pos, len(read_list)
+
+    busy_rows = []  # (key of the row's last region, row)
+    free_rows = []
+    row_count = 0
+    for i, (key, limit) in enumerate(zip(keys.tolist(), limits.tolist())):
+        while busy_rows and busy_rows[0][0] < limit:
+            heapq.heappush(free_rows, heapq.heappop(busy_rows)[1])
+        if free_rows:
+            row = heapq.heappop(free_rows)
+        else:
+            row = row_count
+            row_count += 1
+        y_pos[i] = row
+        heapq.heappush(busy_rows, (key, row))
+
+    return y_pos, row_count
 
 
 ######
@@ -321,6 +431,29 @@ def find_exon(read):
     return zip(blockStart, blockSize)
 
 
+def add_polya(bam_data):
+    """Extend reads by their polyA tail (>= 15 nt) on the 3' side.
+
+    Args:
+        bam_data (pd.DataFrame): convert_bam reads, with strand and polya_len.
+
+    Returns:
+        pd.DataFrame: a copy with polya_len zeroed below 15 and start/end extended.
+    """
+    polya_len = bam_data['polya_len'].to_numpy()
+    polya_len = np.where(polya_len >= 15, polya_len, 0).astype(np.int64)
+    strand = bam_data['strand'].to_numpy()
+    is_plus = strand == '+'
+    is_minus = strand == '-'
+    start = bam_data['start'].to_numpy()
+    end = bam_data['end'].to_numpy()
+    return bam_data.assign(
+        polya_len = polya_len,
+        start = np.where(is_plus, start, np.where(is_minus, start-polya_len, -1)),
+        end = np.where(is_plus, end+polya_len, np.where(is_minus, end, -1)),
+    )
+
+
 def convert_bam(
     chrom, start, end, strand, 
     infile, subsample=None,
@@ -328,7 +461,8 @@ def convert_bam(
     method='continuous',
     filter_strand=None,
     start_before=None, start_after=None,
-    end_before=None, end_after=None
+    end_before=None, end_after=None,
+    threads=1
     ):
     """Conver pysam.reads into a DataFrame.
 
@@ -345,13 +479,21 @@ def convert_bam(
 
         infile (str): the PATH of the bam file
 
-        subsample (int or float, optional): <number>|<frac> of items from axis to return.
-            Defaults to None.
+        subsample (int or float, optional): <number>|<frac> of items from axis to return,
+            drawn from the reads passing the filters below. Defaults to None.
         
         gene_list (set, optional): a set contain which gene to plot. 
             When gene_list is None, plot all item in the df. Defaults to None.
         
-        method ('continuous' | '3_end' | '5_end')
+        method ('continuous' | '3_end' | '5_end' | 'gene_id' | 'spliced' | 'partially_spliced' | 'unspliced')
+
+        filter_strand, start_before, start_after, end_before, end_after:
+            see filter_bam, applied with the 3_end, 5_end and splice state methods.
+
+        threads (int, optional): htslib threads decompressing the bam file. Defaults to 1.
+
+        The filters are evaluated while reading the bam file (see fetch_bam),
+        so reads they reject are never decoded.
 
     Returns:
         DataFrame: A dataframe contain bam reads information
@@ -368,63 +510,174 @@ def convert_bam(
             [(9105672, 832)]      None  
     """    
 
-    bam_data = []
-    with pysam.AlignmentFile(infile, 'rb') as inbam:
+    bam_data = fetch_bam(
+        chrom, start, end, infile,
+        gene_list=gene_list,
+        method=method,
+        filter_strand=filter_strand,
+        start_before=start_before, start_after=start_after,
+        end_before=end_before, end_after=end_after,
+        threads=threads
+        )
+    return arrange_bam(
+        bam_data, strand, subsample=subsample, gene_list=gene_list,
+        method=method,
+        filter_strand=filter_strand,
+        start_before=start_before, start_after=start_after,
+        end_before=end_before, end_after=end_after
+        )
+
+
+# read filters applied by arrange_bam for each method, see fetch_bam
+SPLICE_STATES = {
+    'spliced': lambda span_intron_count, unsplice_count: unsplice_count == 0,
+    'partially_spliced': lambda span_intron_count, unsplice_count: 0 < unsplice_count != span_intron_count,
+    'unspliced': lambda span_intron_count, unsplice_count: unsplice_count == span_intron_count,
+}
+FILTER_BAM_METHODS = {'5_end', '3_end', 'spliced', 'partially_spliced', 'unspliced'}
+
+
+def fetch_bam(
+    chrom, start, end, infile,
+    gene_list=None,
+    method=None,
+    filter_strand=None,
+    start_before=None, start_after=None,
+    end_before=None, end_after=None,
+    threads=1
+    ):
+    """Read the alignments overlapping the region into a DataFrame, in BAM order.
+
+    The gene_list, splice state (method) and filter_bam filters arrange_bam
+    would apply are evaluated here while iterating, so rejected reads are
+    never decoded into rows. With all of them None every read is kept.
+
+    Args:
+        chrom (str): chromosome id
+
+        start (int): start position of the region
+
+        end (int): end position of the region
+
+        infile (str): the PATH of the bam file
+
+        gene_list, method, filter_strand, start_before, start_after,
+        end_before, end_after, threads: see convert_bam.
+
+    Returns:
+        DataFrame: convert_bam columns without y_pos, before any sorting,
+            subsampling or polyA extension.
+    """
+    splice_state = SPLICE_STATES.get(method)
+    if method not in FILTER_BAM_METHODS:
+        # continuous and gene_id layouts ignore filter_bam arguments
+        filter_strand = start_before = start_after = end_before = end_after = None
+    check_bounds = any(bound is not None for bound in (start_before, start_after, end_before, end_after))
+
+    # one typed column per field instead of a list of row tuples
+    chroms, starts, ends, gene_ids, read_strands, read_ids = [], [], [], [], [], []
+    polya_lens, exons, span_intron_counts, unsplice_counts, unsplice_introns = [], [], [], [], []
+    with pysam.AlignmentFile(infile, 'rb', threads=threads) as inbam:
         for read in inbam.fetch(chrom, start, end):
-            gap = 0  # useless value
+            if read.is_supplementary or read.is_unmapped:
+                continue
 
-            try:
-                polya_len = read.get_tag('pa')
-            except KeyError:
-                polya_len = 0
+            gene_id = read.get_tag('gi') if read.has_tag('gi') else 0
+            if gene_list is not None and gene_id not in gene_list:
+                continue
 
-            try:
-                gene_id = read.get_tag('gi')
-            except KeyError:
-                gene_id = 0
+            read_strand = '-' if read.is_reverse else '+'
+            if filter_strand is not None and read_strand != filter_strand:
+                continue
 
-            try:
+            if read.has_tag('sn') and read.has_tag('rn') and read.has_tag('ri'):
                 span_intron_count = read.get_tag('sn')  # span_intron_num
                 unsplice_count = read.get_tag('rn')  # retention_intron_num
                 unsplice_intron = read.get_tag('ri')  # retention_introns
-                # only plot reads in gene_list
-            except KeyError:
+            else:
                 span_intron_count, unsplice_count, unsplice_intron = None, None, None
-                
-            if read.is_supplementary or read.is_unmapped:
+            if splice_state is not None and not (
+                span_intron_count is not None and span_intron_count > 0
+                and splice_state(span_intron_count, unsplice_count)
+            ):
                 continue
-            
-            read_strand = '-' if read.is_reverse else '+'
+
+            polya_len = read.get_tag('pa') if read.has_tag('pa') else 0
+            if check_bounds:
+                # bounds apply to the polyA extended read, as after add_polya
+                read_start, read_end = read.reference_start, read.reference_end
+                if polya_len >= 15:
+                    if read_strand == '+':
+                        read_end += polya_len
+                    else:
+                        read_start -= polya_len
+                if (
+                    (start_before is not None and read_start > start_before)
+                    or (start_after is not None and read_start < start_after)
+                    or (end_before is not None and read_end > end_before)
+                    or (end_after is not None and read_end < end_after)
+                ):
+                    continue
+
             exon = find_exon(read)
 
-            bam_data.append(
-                (read.reference_name, read.reference_start, read.reference_end,
-                 gene_id, read_strand, read.query_name, gap, polya_len, list(exon), 
-                 span_intron_count, unsplice_count, unsplice_intron)
-            )
-    bam_data = pd.DataFrame(
-        bam_data, 
-        columns=[
-            'chrom', 'start', 'end', 'gene_id', 'strand', 'read_id', 'gap', 
-            'polya_len', 'exon', 'span_intron_count', 'unsplice_count', 'unsplice_intron'
-            ]
-    )
+            chroms.append(read.reference_name)
+            starts.append(read.reference_start)
+            ends.append(read.reference_end)
+            gene_ids.append(gene_id)
+            read_strands.append(read_strand)
+            read_ids.append(read.query_name)
+            polya_lens.append(polya_len)
+            exons.append(list(exon))
+            span_intron_counts.append(span_intron_count)
+            unsplice_counts.append(unsplice_count)
+            unsplice_introns.append(unsplice_intron)
+
+    bam_data = pd.DataFrame({
+        'chrom': chroms,
+        'start': np.array(starts, dtype=np.int64),
+        'end': np.array(ends, dtype=np.int64),
+        'gene_id': gene_ids,
+        'strand': read_strands,
+        'read_id': read_ids,
+        'gap': np.zeros(len(starts), dtype=np.int64),  # useless value
+        'polya_len': np.array(polya_lens),
+        'exon': exons,
+        'span_intron_count': span_intron_counts,
+        'unsplice_count': unsplice_counts,
+        'unsplice_intron': unsplice_introns,
+    })
     
+    return bam_data
+
+
+def arrange_bam(
+    bam_data, strand, subsample=None,
+    gene_list=None,
+    method='continuous',
+    filter_strand=None,
+    start_before=None, start_after=None,
+    end_before=None, end_after=None
+    ):
+    """Subsample, sort, filter and lay out the reads of fetch_bam.
+
+    Args are the same as convert_bam.
+
+    Returns:
+        DataFrame: see convert_bam.
+    """
     # 进行subsample
     if subsample is not None:
         if type(subsample) is int:
-            bam_data = bam_data.sample(n=subsample, random_state=42)
+            # fetch_bam already dropped filtered reads, fewer than subsample may be left
+            bam_data = bam_data.sample(n=min(subsample, len(bam_data)), random_state=42)
         elif type(subsample) is float and subsample < 1:
             bam_data = bam_data.sample(frac=subsample, random_state=42)
     
     if method == 'continuous':
         # 类似于igv那样连续的排
         # add polya
-        bam_data['polya_len'] = bam_data['polya_len'].map(lambda x: int(x) if x >= 15 else 0)
-        bam_data = bam_data.assign(
-            start = np.select([bam_data['strand'] == '+', bam_data['strand'] == '-'], [bam_data['start'], bam_data['start']-bam_data['polya_len']], -1),
-            end = np.select([bam_data['strand'] == '+', bam_data['strand'] == '-'], [bam_data['end']+bam_data['polya_len'], bam_data['end']], -1),
-        )
+        bam_data = add_polya(bam_data)
         if strand == '+':
             bam_data.sort_values(['start', 'end'], inplace=True)
         else:
@@ -439,11 +692,7 @@ def convert_bam(
             bam_data.sort_values(['end', 'start'], ascending=False, inplace=True)
         
         # add polya
-        bam_data['polya_len'] = bam_data['polya_len'].map(lambda x: int(x) if x >= 15 else 0)
-        bam_data = bam_data.assign(
-            start = np.select([bam_data['strand'] == '+', bam_data['strand'] == '-'], [bam_data['start'], bam_data['start']-bam_data['polya_len']], -1),
-            end = np.select([bam_data['strand'] == '+', bam_data['strand'] == '-'], [bam_data['end']+bam_data['polya_len'], bam_data['end']], -1),
-        )
+        bam_data = add_polya(bam_data)
         
         filter_bam(bam_data, strand=filter_strand, start_before=start_before, start_after=start_after, end_before=end_before, end_after=end_after)
         get_y_pos_discontinous(bam_data, gene_list=gene_list)
@@ -455,11 +704,7 @@ def convert_bam(
             bam_data.sort_values(['start', 'end'], ascending=False, inplace=True)
 
         # add polya
-        bam_data['polya_len'] = bam_data['polya_len'].map(lambda x: int(x) if x >= 15 else 0)
-        bam_data = bam_data.assign(
-            start = np.select([bam_data['strand'] == '+', bam_data['strand'] == '-'], [bam_data['start'], bam_data['start']-bam_data['polya_len']], -1),
-            end = np.select([bam_data['strand'] == '+', bam_data['strand'] == '-'], [bam_data['end']+bam_data['polya_len'], bam_data['end']], -1),
-        )
+        bam_data = add_polya(bam_data)
         
         filter_bam(bam_data, strand=filter_strand, start_before=start_before, start_after=start_after, end_before=end_before, end_after=end_after)
         get_y_pos_discontinous(bam_data, gene_list=gene_list)
@@ -471,11 +716,7 @@ def convert_bam(
             bam_data.sort_values(['gene_id', 'start', 'end'], ascending=False, inplace=True)
         
         # add polya
-        bam_data['polya_len'] = bam_data['polya_len'].map(lambda x: int(x) if x >= 15 else 0)
-        bam_data = bam_data.assign(
-            start = np.select([bam_data['strand'] == '+', bam_data['strand'] == '-'], [bam_data['start'], bam_data['start']-bam_data['polya_len']], -1),
-            end = np.select([bam_data['strand'] == '+', bam_data['strand'] == '-'], [bam_data['end']+bam_data['polya_len'], bam_data['end']], -1),
-        )
+        bam_data = add_polya(bam_data)
         get_y_pos_discontinous(bam_data, gene_list=gene_list)
     
     elif method == 'spliced':  # 只画完全剪切的reads
@@ -486,11 +727,7 @@ def convert_bam(
             bam_data.sort_values(['start', 'end'], ascending=False, inplace=True)
         
         # add polya
-        bam_data['polya_len'] = bam_data['polya_len'].map(lambda x: int(x) if x >= 15 else 0)
-        bam_data = bam_data.assign(
-            start = np.select([bam_data['strand'] == '+', bam_data['strand'] == '-'], [bam_data['start'], bam_data['start']-bam_data['polya_len']], -1),
-            end = np.select([bam_data['strand'] == '+', bam_data['strand'] == '-'], [bam_data['end']+bam_data['polya_len'], bam_data['end']], -1),
-        )
+        bam_data = add_polya(bam_data)
         filter_bam(bam_data, strand=filter_strand, start_before=start_before, start_after=start_after, end_before=end_before, end_after=end_after)
         get_y_pos_discontinous(bam_data, gene_list=gene_list)
 
@@ -502,11 +739,7 @@ def convert_bam(
             bam_data.sort_values(['start', 'end'], ascending=False, inplace=True)
         
         # add polya
-        bam_data['polya_len'] = bam_data['polya_len'].map(lambda x: int(x) if x >= 15 else 0)
-        bam_data = bam_data.assign(
-            start = np.select([bam_data['strand'] == '+', bam_data['strand'] == '-'], [bam_data['start'], bam_data['start']-bam_data['polya_len']], -1),
-            end = np.select([bam_data['strand'] == '+', bam_data['strand'] == '-'], [bam_data['end']+bam_data['polya_len'], bam_data['end']], -1),
-        )
+        bam_data = add_polya(bam_data)
         filter_bam(bam_data, strand=filter_strand, start_before=start_before, start_after=start_after, end_before=end_before, end_after=end_after)
         get_y_pos_discontinous(bam_data, gene_list=gene_list)
 
@@ -518,11 +751,7 @@ def convert_bam(
             bam_data.sort_values(['start', 'end'], ascending=False, inplace=True)
         
         # add polya
-        bam_data['polya_len'] = bam_data['polya_len'].map(lambda x: int(x) if x >= 15 else 0)
-        bam_data = bam_data.assign(
-            start = np.select([bam_data['strand'] == '+', bam_data['strand'] == '-'], [bam_data['start'], bam_data['start']-bam_data['polya_len']], -1),
-            end = np.select([bam_data['strand'] == '+', bam_data['strand'] == '-'], [bam_data['end']+bam_data['polya_len'], bam_data['end']], -1),
-        )
+        bam_data = add_polya(bam_data)
         filter_bam(bam_data, strand=filter_strand, start_before=start_before, start_after=start_after, end_before=end_before, end_after=end_after)
         get_y_pos_discontinous(bam_data, gene_list=gene_list)
 
@@ -577,49 +806,86 @@ def plot_bam(
 
     gene_color = {}
     gene_color_index = 0
+
+    # (x, y, width, height) rectangles, one collection per colour
+    lines = []
+    blocks = {}
+    polya_tails = []
     
     ylim = 0 # the start position of yaxis
     height = .5 # reads的高度
-    for item in bam_data.values:
-        chrom, start, end, gene_id, strand, read_id, gap, polya_len, exon, *_, ypos,  = item
+    for start, end, gene_id, strand, polya_len, exon, ypos in zip(
+        bam_data['start'], bam_data['end'], bam_data['gene_id'], bam_data['strand'],
+        bam_data['polya_len'], bam_data['exon'], bam_data['y_pos']
+    ):
         ypos = -y_space*ypos
         ylim = min(ypos, ylim)
-        line = mp.Rectangle((start, ypos-height/4), end-start, height/2, color='#A6A6A6', linewidth=0)
-        ax.add_patch(line)
-        for block_start, block_size in exon:
-            
-            # set gene color
-            # index为色板中的序列编号
-            # 如果gene_list存在 则给gene_list里面都基因上色
-            if gene_list is not None:
-                if gene_id in gene_list:
-                    if gene_id not in gene_color:
-                        gene_color[gene_id] = gene_color_index
-                        gene_color_index += 1
-                    read_color_ = pal[gene_color[gene_id]]
-                else:
-                    # 不在gene_list里面的reads都设置成灰色
-                    read_color_ = '#5D5D5D'
-            # 如果没有则统一颜色
+        lines.append((start, ypos-height/4, end-start, height/2))
+        if not exon:
+            continue
+
+        # set gene color
+        # index为色板中的序列编号
+        # 如果gene_list存在 则给gene_list里面都基因上色
+        if gene_list is not None:
+            if gene_id in gene_list:
+                if gene_id not in gene_color:
+                    gene_color[gene_id] = gene_color_index
+                    gene_color_index += 1
+                read_color_ = pal[gene_color[gene_id]]
             else:
-                read_color_ = read_color
-                
-                # TODO: 不同链的reads不同颜色
-            exon = mp.Rectangle((block_start, ypos-height), block_size, height*2, color=read_color_, linewidth=0)
-            ax.add_patch(exon)
+                # 不在gene_list里面的reads都设置成灰色
+                read_color_ = '#5D5D5D'
+        # 如果没有则统一颜色
+        else:
+            read_color_ = read_color
+            
+            # TODO: 不同链的reads不同颜色
+        for block_start, block_size in exon:
+            blocks.setdefault(read_color_, []).append((block_start, ypos-height, block_size, height*2))
 
         # plot polya
         if polya_len > 15:
             if strand == '+':
-                polya_tail = mp.Rectangle((block_start+block_size, ypos-height), polya_len, height*2, color=polya_color, linewidth=0)
+                block_start, block_size = exon[-1]
+                polya_tails.append((block_start+block_size, ypos-height, polya_len, height*2))
             else:
-                polya_tail = mp.Rectangle((start, ypos-height), polya_len, height*2, color=polya_color, linewidth=0)        
-            ax.add_patch(polya_tail)
+                polya_tails.append((start, ypos-height, polya_len, height*2))
+
+    add_rectangles(ax, lines, '#A6A6A6')
+    for color, rects in blocks.items():
+        add_rectangles(ax, rects, color)
+    add_rectangles(ax, polya_tails, polya_color)
 
     ax.set_ylim(ylim*1.1, height+y_space)
     #ax.set_xlim(fig_start, fig_end)
 
 
+def add_rectangles(ax, rects, color):
+    """Add rectangles to the ax as a single PolyCollection
+
+    One artist per colour instead of one patch per block keeps figure
+    build and save time flat for panels with many reads.
+
+    Args:
+        ax (matplotlib.axes): An axis object to plot
+
+        rects (list): (x, y, width, height) of each rectangle
+
+        color: matplotlib color shared by all rectangles
+    """
+    if len(rects) == 0:
+        return
+    x, y, width, height = np.asarray(rects, dtype=float).T
+    verts = np.stack([
+        np.column_stack([x, y]),
+        np.column_stack([x+width, y]),
+        np.column_stack([x+width, y+height]),
+        np.column_stack([x, y+height]),
+    ], axis=1)
+    ax.add_collection(PolyCollection(verts, color=color, linewidth=0))
+
+
 def set_ax(ax, plot_xaxis=False):
     """Set axes
 
@@ -672,6 +938,7 @@ class IGV:
         self.end = end
         self.strand = strand
         self.bam_list = []
+        self.gene_list = None
         
     
     def add_bam(
@@ -679,7 +946,8 @@ class IGV:
         method='continuous',
         filter_strand=None,
         start_before=None, start_after=None,
-        end_before=None, end_after=None
+        end_before=None, end_after=None,
+        threads=1
     ):
         bam_data = convert_bam(
             self.chrom, self.start, self.end, self.strand, 
@@ -687,8 +955,14 @@ class IGV:
             method=method, 
             filter_strand=filter_strand,
             start_before=start_before, start_after=start_after, 
-            end_before=end_before, end_after=end_after
+            end_before=end_before, end_after=end_after,
+            threads=threads
             )
+        self.add_bam_data(bam_data, gene_list=gene_list)
+
+
+    def add_bam_data(self, bam_data, gene_list=None):
+        """Add a track from an already converted convert_bam DataFrame."""
         self.bam_list.append(bam_data)
         self.gene_list = gene_list
     
@@ -728,6 +1002,10 @@ class IGV:
         else:
             plot_gene_model(ax[0], self.gene_models, self.start, self.end, gene_color=gene_color, y_space=6)
         
+        # polyA sites are fetched once and drawn on every bam track
+        if polya_site is not None:
+            polya_sites = get_polya_sites(self.chrom, self.start, self.end, polya_site, gene_list=self.gene_list)
+
         # plot bam files
         for i, bam_data in enumerate(self.bam_list, 1):
             plot_bam(ax[i], bam_data, self.start, self.end, gene_list=self.gene_list)
@@ -736,15 +1014,8 @@ class IGV:
 
             # add polya site
             if polya_site is not None:
-                tbx = pysam.TabixFile(polya_site)
-                for item in tbx.fetch(self.chrom, self.start, self.end):
-                    chrom_, start_, end_, gene_id_, _, strand_, _ = item.split('\t') 
-                    gene_id_ = gene_id_.split('_')[0]
-                    if self.gene_list is not None:
-                        if gene_id_ in self.gene_list:
-                            ax[i].axvline(int(end_), ls='--', color='#555555')
-                    else:
-                        ax[i].axvline(int(end_), ls='--', color='#555555')
+                for site in polya_sites:
+                    ax[i].axvline(site, ls='--', color='#555555')
 
         
         # set last xaxis
@@ -789,4 +1060,174 @@ class IGV:
             ax_.set_xlim(minn, maxn)
             ax_.invert_xaxis()
             
-        return ax
\ No newline at end of file
+        return ax
+
+######
+# batch plot
+######
+
+def merge_regions(regions):
+    """Merge overlapping regions, in coordinate order.
+
+    Args:
+        regions (list): (name, chrom, start, end, strand, ...) tuples.
+
+    Returns:
+        list: (chrom, start, end, [region index, ...]) of each merged interval,
+            region indices sorted by start.
+    """
+    order = sorted(range(len(regions)), key=lambda i: (regions[i][1], regions[i][2], regions[i][3]))
+    merged = []
+    for i in order:
+        _, chrom, start, end, *_ = regions[i]
+        if merged and merged[-1][0] == chrom and start <= merged[-1][2]:
+            merged[-1][2] = max(merged[-1][2], end)
+            merged[-1][3].append(i)
+        else:
+            merged.append([chrom, start, end, [i]])
+    return [tuple(item) for item in merged]
+
+
+def slice_bam(bam_data, start, end):
+    """Reads of a fetch_bam DataFrame overlapping [start, end), as fetch_bam would return them."""
+    keep = (bam_data['end'].to_numpy() > start) & (bam_data['start'].to_numpy() < end)
+    return bam_data[keep].reset_index(drop=True)
+
+
+def _plot_region(task):
+    """Plot one region of plot_genes, runs in the worker processes."""
+    name, chrom, start, end, strand, gene_list, bam_list, anno, polya_site, plot_kwargs, outfile = task
+    igv_plot = IGV(chrom, start, end, strand=strand)
+    igv_plot.add_gene_model(anno)
+    for bam_data in bam_list:
+        igv_plot.add_bam_data(bam_data, gene_list=gene_list)
+    ax = igv_plot.plot(polya_site=polya_site, **plot_kwargs)
+    fig = np.atleast_1d(ax)[0].figure
+    plt.close(fig)
+
+    if outfile is None:
+        # the figure is pickled back and written to the multi-page PDF in order
+        return name, fig
+    fig.savefig(outfile)
+    return name, outfile
+
+
+def _init_plot_worker():
+    import matplotlib
+    matplotlib.use('Agg')
+
+
+def plot_genes(
+    regions, bam_paths, anno, output,
+    polya_site=None,
+    processes=None,
+    fmt='pdf',
+    bam_kwargs=None,
+    threads=1,
+    **plot_kwargs
+):
+    """Plot many regions, reading each bam file once through the merged regions.
+
+    Regions are sorted by coordinate and overlapping ones merged; every bam
+    file is fetched once per merged interval and the reads are split back
+    per region and laid out with the same arrange_bam logic as convert_bam,
+    so every page matches a single IGV(...).add_bam(...).plot(...) call.
+    Figures are built in a process pool while the next regions are read.
+
+    Usage:
+    ------
+        regions = [
+            ('AT5G16440', '5', 5371627, 5375616, '+', {'AT5G16440'}),
+            ('AT1G01020', '1', 6788, 9130, '-', {'AT1G01020'}),
+        ]
+        igv.plot_genes(regions, [bam1, bam2], araport11_isoform_path, 'genes.pdf', height=4, width=8)
+
+    Args:
+    -----
+        regions (list): (name, chrom, start, end, strand) tuples, optionally
+            with a 6th gene_list item passed to add_bam for that region.
+
+        bam_paths (list): bam files, one track per file.
+
+        anno (str): the PATH of the tabix indexed bed12 gene model file.
+
+        output (str): a '.pdf' file to write one page per region, otherwise
+            a directory to write <name>.<fmt> per region.
+
+        polya_site (str, optional): see IGV.plot.
+
+        processes (int, optional): number of worker processes, 1 plots in
+            this process. Defaults to the number of CPUs.
+
+        fmt (str, optional): figure format when output is a directory.
+            Defaults to 'pdf'.
+
+        bam_kwargs (dict, optional): add_bam arguments shared by all regions
+            (subsample, method, filter_strand, start_before, ...).
+
+        threads (int, optional): htslib threads decompressing each bam file.
+            Defaults to 1.
+
+        **plot_kwargs: IGV.plot arguments (height, width, ...).
+
+    Returns:
+        list: region names in the order they were written (coordinate order).
+    """
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor
+    from matplotlib.backends.backend_pdf import PdfPages
+
+    regions = [tuple(region) for region in regions]
+    bam_kwargs = bam_kwargs or {}
+    # everything but gene_list and subsample can be filtered while reading
+    fetch_kwargs = {key: value for key, value in bam_kwargs.items() if key != 'subsample'}
+    to_pdf = output.endswith('.pdf') and not os.path.isdir(output)
+
+    def tasks():
+        for chrom, start, end, indices in merge_regions(regions):
+            # one fetch per bam file for all regions in the merged interval
+            bam_frames = [fetch_bam(chrom, start, end, bam_path, threads=threads, **fetch_kwargs) for bam_path in bam_paths]
+            for i in indices:
+                name, chrom_, start_, end_, strand_, *gene_list = regions[i]
+                gene_list = gene_list[0] if gene_list else None
+                bam_list = [
+                    arrange_bam(slice_bam(bam_data, start_, end_), strand_, gene_list=gene_list, **bam_kwargs)
+                    for bam_data in bam_frames
+                ]
+                outfile = None if to_pdf else os.path.join(output, f'{name}.{fmt}')
+                yield (name, chrom_, start_, end_, strand_, gene_list, bam_list, anno, polya_site, dict(plot_kwargs), outfile)
+
+    names = []
+    def write(result):
+        name, fig = result
+        if to_pdf:
+            pdf.savefig(fig)
+        names.append(name)
+
+    if to_pdf:
+        pdf = PdfPages(output)
+    else:
+        os.makedirs(output, exist_ok=True)
+    try:
+        if processes == 1:
+            for task in tasks():
+                write(_plot_region(task))
+        else:
+            processes = processes or os.cpu_count() or 1
+            with ProcessPoolExecutor(max_workers=processes, initializer=_init_plot_worker) as executor:
+                # keep a few regions in flight so reads are not all held in memory
+                max_pending = 2 * processes
+                pending = deque()
+                for task in tasks():
+                    pending.append(executor.submit(_plot_region, task))
+                    if len(pending) >= max_pending:
+                        write(pending.popleft().result())
+                while pending:
+                    write(pending.popleft().result())
+    finally:
+        if to_pdf:
+            pdf.close()
+        # worker processes close theirs when the pool shuts down
+        close_tabix_handles()
+
+    return names
@@ -1,3 +1,10 @@
-from .visualizer import render_alignment_snapshot
+__version__ = "0.1.0"
 
-__version__ = "0.1.0" 
\ No newline at end of file
+
+def __getattr__(name):
+    # Imported on first use so `import nanostructure` (and the CLI's --help)
+    # does not pull in pysam, svgwrite and Pillow
+    if name == 'render_alignment_snapshot':
+        from .visualizer import render_alignment_snapshot
+        return render_alignment_snapshot
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}") 
\ No newline at end of file
@@ -1,13 +1,50 @@
-from .visualizer import render_alignment_snapshot
 import click
 
-@click.command()
-@click.option('--bam', '-b', type=click.Path(exists=True), required=True, help='BAM file path')
+
+class DefaultGroup(click.Group):
+    """Group that runs ``render`` when no subcommand is given
+
+    Keeps ``nanostructure -b sample.bam -p chr1:1000-2000`` working next to
+    ``nanostructure serve``.
+    """
+    default_command = 'render'
+
+    def parse_args(self, ctx, args):
+        if args and args[0] not in self.commands and args[0] != '--help':
+            args = [self.default_command] + list(args)
+        return super().parse_args(ctx, args)
+
+
+@click.group(cls=DefaultGroup)
+def main():
+    """NanoStructure: BAM alignment snapshots.
+
+    render is the default command: options given without a command are
+    passed to it, as in
+
+    \b
+        nanostructure -b sample.bam -p chr1:1000-2000 -o snapshot.svg
+
+    Run 'nanostructure render --help' for all rendering options.
+    """
+
+
+@main.command()
+@click.option('--bam', '-b', type=click.Path(exists=True), required=True, multiple=True,
+              help='BAM or CRAM file path, repeat to stack one panel per sample')
+@click.option('--reference', '-r', type=click.Path(exists=True, dir_okay=False),
+              help='Indexed reference FASTA the CRAM files were encoded against; the contigs read are '
+                   'cached under --cache-dir, without it every render decodes from the FASTA')
+@click.option('--sample-name', multiple=True,
+              help='Panel label per --bam, in the same order (default: file names)')
 @click.option('--position', '-p', type=str, help='Genomic position (e.g., "chr1:1000-2000")')
 @click.option('--transcript', '-t', type=str, help='Transcript name')
+@click.option('--gene', type=str, help='Gene ID or name, drawn with all of its isoforms (needs --gtf)')
+@click.option('--isoforms', type=click.Choice(['stacked', 'collapsed']), default='stacked',
+              help='With --gene, draw each isoform on its own row or merge them into one model')
 @click.option('--output', '-o', default='output.png', help='Output image path')
 @click.option('--title', help='Title for the visualization', default='NanoStructure')
-@click.option('--gtf', '-g', type=click.Path(exists=True), help='Gene annotation GTF file')
+@click.option('--gtf', '-g', type=click.Path(exists=True), help='Gene annotation GTF file; with --position every overlapping transcript is drawn')
 @click.option('--strand-direction', '-s', type=click.Choice(['F', 'R', 'B']), default='B',
               help='Strand direction to display (F=Forward, R=Reverse, B=Both)')
 @click.option('--image-width', '-w', type=int, default=1000, help='Width of the output image')
@@ -15,13 +52,51 @@ import click
 @click.option('--track-spacing', '-s', type=int, help='Spacing between tracks')
 @click.option('--max-reads', '-m', type=int, default=100, help='Maximum number of reads to display')
 @click.option('--flanking', type=int, default=100, help='Flanking region size around gene')
-def main(bam, position, transcript, output, title, gtf, strand_direction, 
-         image_width, read_height, track_spacing, max_reads, flanking):
+@click.option('--read-display-method', '-d',
+              type=click.Choice(['continuous', 'downsample', '3_end', '5_end']),
+              default='continuous',
+              help='Method to handle many reads (continuous=IGV-like packing, downsample=random sampling)')
+@click.option('--seed', type=int, help='Random seed for --read-display-method downsample')
+@click.option('--coverage/--no-coverage', default=True, help='Draw a coverage track above the reads')
+@click.option('--mismatch-threshold', type=float, default=0.2,
+              help='Mismatch fraction at which coverage columns are highlighted')
+@click.option('--cache-dir', type=click.Path(file_okay=False),
+              help='Directory caching decoded reads so repeat or zoomed renders skip BAM decoding, '
+                   'and the CRAM reference sequences')
+@click.option('--io-threads', type=click.IntRange(min=1), default=1,
+              help='Threads decompressing each BAM (htslib BGZF/CRAM decoding)')
+@click.option('--profile', is_flag=True,
+              help='Print a per-stage timing breakdown and write it to <output>.profile.json')
+@click.option('--cprofile', is_flag=True, help='With --profile, also report the slowest functions (cProfile)')
+def render(bam, reference, sample_name, position, transcript, gene, isoforms, output, title, gtf, strand_direction, 
+         image_width, read_height, track_spacing, max_reads, flanking, read_display_method,
+         seed, coverage, mismatch_threshold, cache_dir, io_threads, profile, cprofile):
     """Create BAM alignment visualization at specified genomic position or gene."""
+    if output.endswith(('.png', '.pdf')):
+        # Fail before fetching and drawing when the optional cairo extra is missing
+        from .utils.renderers.vector_renderer import _import_cairosvg
+        try:
+            _import_cairosvg()
+        except ImportError as e:
+            raise click.ClickException(str(e))
+    # Heavy dependencies are only imported once the arguments are valid
+    from .visualizer import render_alignment_snapshot
+    from .utils.tile_cache import TileCache
+    cache = TileCache(cache_dir=cache_dir) if cache_dir else None
+    if reference and cache is not None:
+        from .utils.reference_cache import use_reference_cache
+        use_reference_cache(cache.reference_cache)
+    profiler = None
+    if profile or cprofile:
+        from .utils.profiling import StageProfiler
+        profiler = StageProfiler(cprofile=cprofile)
     render_alignment_snapshot(
-        bam_path=bam,
+        bam_path=bam[0] if len(bam) == 1 else list(bam),
+        sample_names=list(sample_name) or None,
         position=position,
         transcript=transcript,
+        gene=gene,
+        isoforms=isoforms,
         output_path=output,
         title=title,
         gtf_file=gtf,
@@ -30,5 +105,67 @@ def main(bam, position, transcript, output, title, gtf, strand_direction,
         read_height=read_height,
         track_spacing=track_spacing,
         max_reads=max_reads,
-        flanking=flanking
-    ) 
\ No newline at end of file
+        flanking=flanking,
+        read_display_method=read_display_method,
+        seed=seed,
+        show_coverage=coverage,
+        mismatch_threshold=mismatch_threshold,
+        cache=cache,
+        profiler=profiler,
+        reference=reference,
+        io_threads=io_threads
+    )
+    if profiler is not None:
+        profile_path = f"{output}.profile.json"
+        profiler.write_json(profile_path)
+        click.echo(profiler.format(), err=True)
+        click.echo(f"Profile written to {profile_path}", err=True)
+
+
+@main.command()
+@click.option('--host', default='127.0.0.1', help='Address to listen on')
+@click.option('--port', type=int, default=8765, help='HTTP port')
+@click.option('--socket', 'socket_path', type=click.Path(dir_okay=False),
+              help='Listen on this Unix socket instead of HTTP host/port')
+@click.option('--workers', type=int, default=4, help='Number of concurrent render workers')
+@click.option('--processes', is_flag=True,
+              help='Render in worker processes instead of threads (scales CPU-bound drawing)')
+@click.option('--gtf', '-g', type=click.Path(exists=True), help='Gene annotation GTF file, indexed at start-up')
+@click.option('--bam-root', type=click.Path(exists=True, file_okay=False),
+              help='Only serve BAM files below this directory (default: the working directory)')
+@click.option('--reference', '-r', type=click.Path(exists=True, dir_okay=False),
+              help='Indexed reference FASTA for CRAM files; the contigs read are cached under '
+                   '--cache-dir, without it every request decodes from the FASTA')
+@click.option('--cache-dir', type=click.Path(file_okay=False),
+              help='Directory caching decoded reads across requests and restarts')
+@click.option('--image-width', '-w', type=int, default=1000, help='Default image width')
+@click.option('--max-reads', '-m', type=int, default=100, help='Default maximum number of reads')
+@click.option('--io-threads', type=click.IntRange(min=1), default=1,
+              help='Threads decompressing each open BAM (htslib BGZF/CRAM decoding)')
+@click.option('--quiet', is_flag=True, help='Do not log requests')
+def serve(host, port, socket_path, workers, processes, gtf, bam_root, reference, cache_dir, image_width, max_reads, io_threads, quiet):
+    """Serve snapshots on demand, keeping BAM handles and annotation warm.
+
+    Request images with GET /snapshot?bam=...&region=chr1:1000-2000&format=png
+    """
+    from .server import SnapshotService, serve as run_server
+    from .utils.tile_cache import TileCache
+    cache = TileCache(cache_dir=cache_dir) if cache_dir else None
+    if reference and cache is not None:
+        # Set before any worker thread or process opens a CRAM
+        from .utils.reference_cache import use_reference_cache
+        use_reference_cache(cache.reference_cache)
+    service = SnapshotService(
+        gtf_file=gtf,
+        bam_root=bam_root,
+        reference=reference,
+        cache=cache,
+        image_width=image_width,
+        max_reads=max_reads,
+        io_threads=io_threads
+    )
+    try:
+        run_server(service, host=host, port=port, socket_path=socket_path,
+                   workers=workers, processes=processes, quiet=quiet)
+    except FileExistsError as e:
+        raise click.ClickException(str(e))
@@ -12,6 +12,21 @@ COLORS = {
         'R': '#eb5252',  # Reverse reads
         'B': '#163f63'   # Both strands
     },
+
+    # Read block colors by alignment operation
+    'blocks': {
+        'intron': '#A6A6A6',     # Read backbone / skipped region line
+        'mismatch': '#FF0000',   # Red
+        'insertion': '#304FFE',  # Blue
+        'deletion': '#7DFF6F',   # Green
+    },
+
+    # Coverage track colors
+    'coverage': {
+        'fill': '#A6A6A6',       # Depth bars
+        'mismatch': '#FF0000',   # Mismatch fraction above threshold
+        'label': '#333333',      # Depth range label
+    },
     
     # Gene structure colors and styles
     'gene': {
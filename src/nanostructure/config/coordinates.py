@@ -8,6 +8,12 @@ COORDINATES = {
         'min_bar_size': 5,        # 最小条形图大小
         'min_axis_label_width': 50,  # 坐标轴标签最小宽度
         'gap_label_and_bar': 15,   # 增加标签和刻度线之间的间距
+        'coverage_height': 40,     # Coverage track height
+        'coverage_margin': 10,     # Space between coverage track and reads
+        'panel_label_height': 16,  # Sample name above each multi-BAM panel
+        'panel_gap': 10,           # Space between stacked sample panels
+        'gene_row_gap': 18,        # Space between stacked transcripts, holds their labels
+        'max_gene_rows': 20,       # Transcripts beyond this many rows are not drawn
     },
     'margins': {
         'top': 50,    # 顶部边距，为标题和坐标轴预留空间
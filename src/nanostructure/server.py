@@ -0,0 +1,339 @@
+"""Long-running snapshot server
+
+Keeps BAM handles, the parsed annotation and fonts warm between requests so
+an image only costs the fetch and the drawing, not interpreter start-up,
+imports, BAM open and GTF parsing. Connections are handled on an asyncio
+loop while fetching and drawing run in a worker pool, so slow BAM reads
+overlap, and identical requests in flight share a single render.
+
+    GET /snapshot?bam=sample.bam&region=chr1:1000-11000&format=png
+    GET /snapshot?bam=sample.bam&transcript=ENST00000367770&width=1500
+    GET /snapshot?bam=sample.bam&gene=BRCA2&isoforms=collapsed
+    GET /health
+"""
+import asyncio
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import urlparse, parse_qs
+
+from .visualizer import render_alignment_snapshot
+from .utils.alignment_utils import open_alignment_file
+from .utils.coordinates.gene_coordinates import load_annotation_index
+
+CONTENT_TYPES = {
+    'svg': 'image/svg+xml',
+    'png': 'image/png',
+    'pdf': 'application/pdf',
+}
+READ_DISPLAY_METHODS = ('continuous', 'downsample', '3_end', '5_end')
+
+
+class BamHandlePool:
+    """Open pysam.AlignmentFile handles kept per worker thread
+
+    pysam handles must not be shared between threads, so each worker keeps
+    its own and reopens it when the file on disk changes.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def get(self, bam_path, reference=None, threads=1):
+        handles = self._local.__dict__.setdefault('handles', {})
+        bam_stat = os.stat(bam_path)
+        key = (bam_stat.st_size, bam_stat.st_mtime_ns)
+
+        entry = handles.get(bam_path)
+        if entry is None or entry[0] != key:
+            if entry is not None:
+                entry[1].close()
+            entry = (key, open_alignment_file(bam_path, reference, threads=threads))
+            handles[bam_path] = entry
+        return entry[1]
+
+    def __reduce__(self):
+        # Handles belong to one process, a copy sent to a worker starts empty
+        return (BamHandlePool, ())
+
+
+class SnapshotService:
+    """Turn query parameters into rendered snapshot bytes"""
+
+    def __init__(self, gtf_file=None, bam_root=None, cache=None, image_width=1000,
+                 max_reads=100, read_display_method='continuous', reference=None, io_threads=1):
+        """
+        Args:
+            gtf_file (str, optional): Annotation used for ``transcript=`` and ``gene=``
+                requests and the gene model of ``region=`` requests, indexed once at start-up
+            bam_root (str, optional): Only serve BAM files below this directory,
+                defaults to the working directory; relative ``bam=`` paths are
+                resolved against it
+            cache (TileCache, optional): Decoded-read cache shared by all requests
+            reference (str, optional): Reference FASTA for CRAM files
+            io_threads (int): htslib decompression threads per open BAM
+        """
+        self.gtf_file = gtf_file
+        self.bam_root = os.path.realpath(bam_root or os.getcwd())
+        self.cache = cache
+        self.image_width = image_width
+        self.max_reads = max_reads
+        self.read_display_method = read_display_method
+        self.reference = reference
+        self.io_threads = io_threads
+        self.handles = BamHandlePool()
+
+        if gtf_file:
+            # Transcript, gene and region lookups all go through the index,
+            # memory-mapped and shared by worker processes with a cache_dir
+            load_annotation_index(gtf_file, cache_dir=cache.cache_dir if cache is not None else None)
+
+    @staticmethod
+    def request_key(params):
+        """Key under which identical in-flight requests are coalesced"""
+        key = dict(params)
+        if 'bam' in key:
+            key['bam'] = os.path.normpath(key['bam'])
+        return tuple(sorted(key.items()))
+
+    def resolve_bam(self, bam):
+        # Absolute paths and symlinks are checked against the root too
+        bam_path = os.path.realpath(os.path.join(self.bam_root, bam))
+        if os.path.commonpath([bam_path, self.bam_root]) != self.bam_root:
+            raise PermissionError(f"{bam} is outside the served directory")
+        if not os.path.isfile(bam_path):
+            raise FileNotFoundError(f"BAM file not found: {bam}")
+        return bam_path
+
+    def render(self, params):
+        """Render one snapshot
+
+        Args:
+            params (dict): Query parameters: ``bam`` (comma-separated for
+                stacked sample panels) and ``region``, ``transcript`` or ``gene`` are required; ``format`` (svg/png/pdf),
+                ``width``, ``max_reads``, ``method``, ``strand``, ``title``,
+                ``flanking``, ``seed``, ``coverage`` (0/1) and ``isoforms``
+                (stacked/collapsed) are optional
+
+        Returns:
+            tuple: (bytes, content type)
+        """
+        if 'bam' not in params:
+            raise ValueError("Missing 'bam' parameter")
+        if 'region' not in params and 'transcript' not in params and 'gene' not in params:
+            raise ValueError("Either 'region', 'transcript' or 'gene' is required")
+        if ('transcript' in params or 'gene' in params) and not self.gtf_file:
+            raise ValueError("Server was started without --gtf, use 'region'")
+
+        fmt = params.get('format', 'svg').lower()
+        if fmt not in CONTENT_TYPES:
+            raise ValueError(f"format must be one of: {', '.join(CONTENT_TYPES)}")
+        method = params.get('method', self.read_display_method)
+        if method not in READ_DISPLAY_METHODS:
+            raise ValueError(f"method must be one of: {', '.join(READ_DISPLAY_METHODS)}")
+
+        bam_paths = [self.resolve_bam(bam) for bam in params['bam'].split(',')]
+        if len(set(bam_paths)) != len(bam_paths):
+            raise ValueError("Each BAM may only be listed once")
+        # The tile cache keys on the path and only opens the BAM on a miss
+        if self.cache is None:
+            bams = [self.handles.get(bam_path, self.reference, self.io_threads) for bam_path in bam_paths]
+        else:
+            bams = bam_paths
+
+        tmp_dir = tempfile.mkdtemp(prefix='nanostructure-')
+        try:
+            output_path = os.path.join(tmp_dir, f'snapshot.{fmt}')
+            render_alignment_snapshot(
+                bams[0] if len(bams) == 1 else bams,
+                position=params.get('region'),
+                transcript=params.get('transcript'),
+                gene=params.get('gene'),
+                isoforms=params.get('isoforms', 'stacked'),
+                gtf_file=self.gtf_file,
+                output_path=output_path,
+                title=params.get('title'),
+                strand_direction=params.get('strand', 'B'),
+                image_width=int(params.get('width', self.image_width)),
+                max_reads=int(params.get('max_reads', self.max_reads)),
+                flanking=int(params.get('flanking', 100)),
+                read_display_method=method,
+                seed=int(params['seed']) if 'seed' in params else None,
+                show_coverage=params.get('coverage', '1') not in ('0', 'false', 'no'),
+                cache=self.cache,
+                reference=self.reference,
+                io_threads=self.io_threads
+            )
+            with open(output_path, 'rb') as f:
+                return f.read(), CONTENT_TYPES[fmt]
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+# Service of the current worker process, see SnapshotServer(processes=True)
+_worker_service = None
+
+
+def _init_worker(service):
+    global _worker_service
+    _worker_service = service
+    if service.gtf_file:
+        load_annotation_index(service.gtf_file,
+                              cache_dir=service.cache.cache_dir if service.cache is not None else None)
+
+
+def _render_in_worker(params):
+    return _worker_service.render(params)
+
+
+class SnapshotServer:
+    """Minimal asyncio HTTP/1.0 front end for a SnapshotService
+
+    Renders run in a pool of ``workers`` threads, or processes when
+    ``processes`` is set (rasterisation and read decoding then scale past
+    the GIL). Requests with the same parameters arriving while one is being
+    rendered wait for that render instead of starting their own.
+    """
+
+    MAX_HEADER_SIZE = 65536
+
+    def __init__(self, service, workers=4, processes=False, quiet=False):
+        self.service = service
+        self.workers = workers
+        self.quiet = quiet
+        if processes:
+            self.executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                                initargs=(service,))
+            self._render = _render_in_worker
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='snapshot')
+            self._render = service.render
+        self._inflight = {}
+        self.stats = {'renders': 0, 'coalesced': 0}
+
+    async def render(self, params):
+        """Render in the pool, joining an identical render already in flight"""
+        key = self.service.request_key(params)
+        future = self._inflight.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self.executor, self._render, params)
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+            self.stats['renders'] += 1
+        else:
+            self.stats['coalesced'] += 1
+        # A client hanging up must not cancel the render for the others
+        return await asyncio.shield(future)
+
+    async def handle_client(self, reader, writer):
+        request_line = ''
+        status = HTTPStatus.INTERNAL_SERVER_ERROR
+        body = b''
+        try:
+            try:
+                header = await reader.readuntil(b'\r\n\r\n')
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                return
+            request_line = header.split(b'\r\n', 1)[0].decode('latin-1')
+            status, body, content_type = await self.respond(request_line)
+            writer.write(
+                f"HTTP/1.0 {status.value} {status.phrase}\r\n"
+                f"Server: NanoStructure\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n".encode('latin-1')
+            )
+            writer.write(body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            if request_line and not self.quiet:
+                peer = writer.get_extra_info('peername')
+                client = peer[0] if isinstance(peer, tuple) else 'unix'
+                sys.stderr.write(f'{client} "{request_line}" {status.value} {len(body)}\n')
+
+    async def respond(self, request_line):
+        """Return (status, body, content type) for one request line"""
+        try:
+            method, target, _ = request_line.split(' ', 2)
+        except ValueError:
+            return self._error(HTTPStatus.BAD_REQUEST, "Malformed request line")
+        if method != 'GET':
+            return self._error(HTTPStatus.METHOD_NOT_ALLOWED, f"Unsupported method {method}")
+
+        url = urlparse(target)
+        if url.path == '/health':
+            return HTTPStatus.OK, b'ok\n', 'text/plain'
+        if url.path not in ('/', '/snapshot'):
+            return self._error(HTTPStatus.NOT_FOUND, f"Unknown path {url.path}")
+
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            body, content_type = await self.render(params)
+        except FileNotFoundError as e:
+            return self._error(HTTPStatus.NOT_FOUND, str(e))
+        except PermissionError as e:
+            return self._error(HTTPStatus.FORBIDDEN, str(e))
+        except (ValueError, KeyError) as e:
+            return self._error(HTTPStatus.BAD_REQUEST, str(e))
+        except Exception as e:
+            sys.stderr.write(f"Render failed for {target}: {e!r}\n")
+            return self._error(HTTPStatus.INTERNAL_SERVER_ERROR, str(e))
+        return HTTPStatus.OK, body, content_type
+
+    @staticmethod
+    def _error(status, message):
+        return status, f"{message}\n".encode('utf-8'), 'text/plain; charset=utf-8'
+
+    async def start(self, host='127.0.0.1', port=8765, socket_path=None):
+        """Start listening and return the asyncio server"""
+        if socket_path:
+            if os.path.exists(socket_path):
+                # Only replace a stale socket, never some other file
+                if not stat.S_ISSOCK(os.stat(socket_path).st_mode):
+                    raise FileExistsError(f"{socket_path} exists and is not a socket")
+                os.unlink(socket_path)
+            return await asyncio.start_unix_server(self.handle_client, path=socket_path,
+                                                   limit=self.MAX_HEADER_SIZE)
+        return await asyncio.start_server(self.handle_client, host, port,
+                                          limit=self.MAX_HEADER_SIZE)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+
+def serve(service, host='127.0.0.1', port=8765, socket_path=None, workers=4,
+          processes=False, quiet=False):
+    """Serve snapshots over HTTP on host:port, or on a Unix socket, until interrupted"""
+    server = SnapshotServer(service, workers=workers, processes=processes, quiet=quiet)
+
+    async def run():
+        listener = await server.start(host, port, socket_path)
+        if socket_path:
+            address = socket_path
+        else:
+            address = f"http://{host}:{listener.sockets[0].getsockname()[1]}"
+        pool = 'processes' if processes else 'threads'
+        print(f"NanoStructure snapshot server listening on {address} ({workers} worker {pool})")
+        try:
+            async with listener:
+                await listener.serve_forever()
+        finally:
+            # Only remove the socket this server bound
+            if socket_path and os.path.exists(socket_path):
+                os.unlink(socket_path)
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
@@ -1,8 +1,55 @@
+import heapq
 import pysam
 import random
-from .coordinate_utils import find_available_track_position
+from .coordinate_utils import assign_track_rows
+from .read_records import BlockStore, ReadRecord, DecodedRead
+from .profiling import NULL_PROFILER
 import re
 
+MD_PATTERN = re.compile(r'(\d+)|(\^[A-Z]+)|([A-Z])')
+
+def find_mismatch_positions(read):
+    """Find reference positions of mismatched bases from the MD tag
+    
+    MD offsets count the reference bases covered by M/=/X and D operations,
+    so they are mapped back through the CIGAR to step over introns (N).
+    
+    Returns:
+        list of int: 0-based reference positions, empty if the read has no MD tag
+    """
+    if not read.has_tag("MD"):
+        return []
+    
+    # Reference segments described by the MD string, in order
+    segments = []
+    ref_pos = read.reference_start
+    for op, length in read.cigartuples:
+        if op in (0, 2, 7, 8):  # M/D/=/X
+            segments.append((ref_pos, length))
+            ref_pos += length
+        elif op == 3:  # N
+            ref_pos += length
+    
+    mismatch_pos = []
+    md_offset = 0
+    segment_index = 0
+    segment_offset = 0  # MD offset at the start of the current segment
+    for match in MD_PATTERN.finditer(read.get_tag("MD")):
+        if match.group(1):  # Matched bases
+            md_offset += int(match.group(1))
+        elif match.group(2):  # Deletion
+            md_offset += len(match.group(2)) - 1
+        elif match.group(3):  # Mismatch
+            while (segment_index < len(segments) and
+                   md_offset >= segment_offset + segments[segment_index][1]):
+                segment_offset += segments[segment_index][1]
+                segment_index += 1
+            if segment_index < len(segments):
+                mismatch_pos.append(segments[segment_index][0] + md_offset - segment_offset)
+            md_offset += 1
+    
+    return mismatch_pos
+
 def find_exon_blocks(read):
     """Find exon positions and their operation types in the read alignment
     
@@ -10,24 +57,11 @@ def find_exon_blocks(read):
         list of tuples: (position, length, operation_type, sequence)
     """
     blocks = []
-    current_pos = read.reference_start
     query_pos = 0
     
     # Get MD tag for accurate mismatch information
-    mdtag = read.get_tag("MD")
-    mismatch_pos = []
+    mismatch_pos = set(find_mismatch_positions(read))
     
-    # Parse MD tag to find mismatches
-    for match in re.finditer(r'(\d+)|(\^[A-Z]+)|([A-Z])', mdtag):
-        if match.group(1):  # Matched bases
-            current_pos += int(match.group(1))
-        elif match.group(2):  # Deletion
-            continue
-        elif match.group(3):  # Mismatch
-            mismatch_pos.append(current_pos)
-            current_pos += 1
-    
-    # Reset position for CIGAR parsing
     current_pos = read.reference_start
     
     for op, length in read.cigartuples:
@@ -70,99 +104,247 @@ def find_exon_blocks(read):
     
     return blocks
 
-def collect_read_alignments(bam_path, chrom, start_pos, end_pos, image_width, max_reads=100, method='continuous'):
+def open_alignment_file(path, reference=None, reference_cache=None, contigs=None, threads=1):
+    """Open a BAM, or a CRAM file decoded against a reference, for reading
+    
+    Args:
+        path (str): BAM (.bai/.csi index) or CRAM (.crai index) file
+        reference (str, optional): FASTA the CRAM was encoded against; without
+            it htslib looks the sequences up through REF_PATH/REF_CACHE
+        reference_cache (str, optional): Directory htslib was pointed at with
+            ``use_reference_cache``; the ``contigs`` are copied there from the
+            FASTA by MD5 and their slices decoded from the copies
+        contigs (list of str, optional): Reference sequences the reads will
+            be fetched from, needed to use ``reference_cache``
+        threads (int): htslib threads decompressing BGZF blocks (BAM) or
+            decoding containers (CRAM) alongside the reading thread
+    
+    Returns:
+        pysam.AlignmentFile
+    """
+    if not str(path).endswith('.cram'):
+        return pysam.AlignmentFile(path, 'rb', threads=threads)
+    if reference is not None and reference_cache is not None and contigs:
+        from .reference_cache import populate_reference_cache, reference_cache_in_use
+        if reference_cache_in_use(reference_cache):
+            digests = populate_reference_cache(reference, reference_cache, contigs)
+            cram = pysam.AlignmentFile(path, 'rc', threads=threads)
+            header_digests = {sq['SN']: sq.get('M5') for sq in cram.header.to_dict().get('SQ', [])}
+            if all(contig in digests and header_digests.get(contig) == digests[contig] for contig in contigs):
+                return cram
+            # Sequences missing from the cache are read from the FASTA
+            cram.close()
+    if reference is not None:
+        return pysam.AlignmentFile(path, 'rc', reference_filename=reference, threads=threads)
+    return pysam.AlignmentFile(path, 'rc', threads=threads)
+
+def is_drawable(read):
+    """Whether a fetched read can be placed on the snapshot"""
+    return not (read.is_unmapped or read.reference_start is None or not read.cigartuples)
+
+def decode_read(read):
+    """Decode a pysam read into a width-independent DecodedRead"""
+    read_start = read.reference_start
+    read_end = read.reference_end or (read_start + len(read.query_sequence))
+    return DecodedRead(read_start, read_end, read.is_reverse, find_exon_blocks(read),
+                       read.get_blocks(), find_mismatch_positions(read))
+
+def build_read_track(read, x_start, x_end, start_pos, end_pos, image_width, store):
+    """Decode a read's blocks and convert them to image coordinates
+    
+    Args:
+        store (BlockStore): Shared block storage the image blocks are appended to
+    
+    Returns:
+        ReadRecord: pixel span, strand and block slice; the read itself is not kept
+    """
+    # Get exon blocks
+    if isinstance(read, DecodedRead):
+        exon_blocks = read.exon_blocks
+    else:
+        exon_blocks = find_exon_blocks(read)
+    
+    # Convert exon blocks
+    image_blocks = []
+    for block_start, block_length, op_type, sequence in exon_blocks:
+        block_x_start = int((block_start - start_pos) * image_width / (end_pos - start_pos))
+        block_x_end = int((block_start + block_length - start_pos) * image_width / (end_pos - start_pos))
+        image_blocks.append((block_x_start, block_x_end, op_type))
+    
+    return ReadRecord(x_start, x_end, read.is_reverse, store, image_blocks)
+
+def end_selection_key(method, is_reverse, x_start, x_end, fetch_index):
+    """Heap key for the 3'/5' end modes, larger is better
+    
+    Orders reads like the stable sorts these modes used to do: by the
+    read's 3' (or 5') end, ties broken by fetch order.
+    """
+    by_end = (method == '3_end') != is_reverse
+    return (x_end if by_end else -x_start, -fetch_index)
+
+def collect_read_alignments(bam_path, chrom, start_pos, end_pos, image_width, max_reads=100, method='continuous',
+                            coverage=None, seed=None, cache=None, profiler=None, reference=None,
+                            threads=1):
     """Collect and process read alignments from BAM file with downsampling
     
     Args:
+        bam_path (str or pysam.AlignmentFile): BAM or CRAM path, or an already
+            open handle that is reused and left open
         method (str): How to handle many reads:
             - 'continuous': Similar to IGV, pack reads continuously 
+            - 'downsample': Reservoir-sample max_reads reads while fetching,
+              only the sampled reads are decoded
             - '3_end': Sort by 3' end and take top max_reads
             - '5_end': Sort by 5' end and take top max_reads
+              (both keep bounded per-strand heaps while fetching and only
+              decode the selected reads)
+        coverage (CoverageTrack, optional): Accumulator fed with every fetched
+            read in the same pass, before any read selection
+        seed (int, optional): Random seed for 'downsample'
+        cache (TileCache, optional): Serve already decoded reads from this
+            tile cache; only tiles not cached yet are fetched and decoded
+        profiler (StageProfiler, optional): Receives 'collect.decode',
+            'collect.coverage' and 'collect.pack' times and read/block counts
+        reference (str, optional): Reference FASTA for CRAM input
+        threads (int): htslib decompression threads when bam_path is opened here
+    
+    Returns:
+        tuple: (forward_tracks, reverse_tracks) lists of ReadRecord sharing one BlockStore
     """
-    bam = pysam.AlignmentFile(bam_path, 'rb')
     forward_tracks = []
     reverse_tracks = []
+    store = BlockStore()
+    
+    if profiler is None:
+        profiler = NULL_PROFILER
+    # Entered once per read, so the stage objects are created up front
+    decode_stage = profiler.stage('collect.decode')
+    coverage_stage = profiler.stage('collect.coverage')
+    fetched_count = 0
+    
+    if cache is not None:
+        bam = None
+        reads = cache.fetch(bam_path, chrom, start_pos, end_pos, reference=reference, threads=threads)
+    elif isinstance(bam_path, pysam.AlignmentFile):
+        bam = bam_path
+        reads = bam.fetch(chrom, start_pos, end_pos)
+    else:
+        bam = open_alignment_file(bam_path, reference, threads=threads)
+        reads = bam.fetch(chrom, start_pos, end_pos)
     
-    # Collect all reads first
-    for read in bam.fetch(chrom, start_pos, end_pos):
-        if read.is_unmapped or read.reference_start is None or not read.cigartuples:
+    # Reservoir of (fetch_index, read, x_start, x_end) for 'downsample'
+    reservoir = []
+    rng = random.Random(seed)
+    candidate_count = 0
+    
+    # Bounded min-heaps of (key, read, x_start, x_end) for '3_end'/'5_end'
+    forward_heap = []
+    reverse_heap = []
+    forward_count = 0
+    reverse_count = 0
+    
+    for read in reads:
+        if bam is not None and not is_drawable(read):
             continue
+        fetched_count += 1
+        
+        if coverage is not None:
+            with coverage_stage:
+                if bam is None:
+                    coverage.add_blocks(read.aligned_blocks, read.mismatches)
+                else:
+                    coverage.add_blocks(read.get_blocks(), find_mismatch_positions(read))
             
         read_start = read.reference_start
         read_end = read.reference_end or (read_start + len(read.query_sequence))
-            
-        # Get exon blocks
-        exon_blocks = find_exon_blocks(read)
         
         # Convert coordinates
         x_start = int((read_start - start_pos) * image_width / (end_pos - start_pos))
         x_end = int((read_end - start_pos) * image_width / (end_pos - start_pos))
-        
-        # Convert exon blocks
-        image_blocks = []
-        for block_start, block_length, op_type, sequence in exon_blocks:
-            block_x_start = int((block_start - start_pos) * image_width / (end_pos - start_pos))
-            block_x_end = int((block_start + block_length - start_pos) * image_width / (end_pos - start_pos))
-            image_blocks.append((block_x_start, block_x_end, op_type))
-        
         x_start = max(0, min(x_start, image_width))
         x_end = max(0, min(x_end, image_width))
         
-        if x_end > x_start:
+        if x_end <= x_start:
+            continue
+        
+        if method == 'downsample':
+            # Algorithm R: keep each candidate with probability max_reads/n
+            if len(reservoir) < max_reads:
+                reservoir.append((candidate_count, read, x_start, x_end))
+            else:
+                slot = rng.randrange(candidate_count + 1)
+                if slot < max_reads:
+                    reservoir[slot] = (candidate_count, read, x_start, x_end)
+            candidate_count += 1
+            continue
+        
+        if method in ('3_end', '5_end'):
+            key = end_selection_key(method, read.is_reverse, x_start, x_end, candidate_count)
+            candidate_count += 1
             if read.is_reverse:
-                reverse_tracks.append((x_start, x_end, 0, read, image_blocks))
+                heap = reverse_heap
+                reverse_count += 1
             else:
-                forward_tracks.append((x_start, x_end, 0, read, image_blocks))
-
+                heap = forward_heap
+                forward_count += 1
+            # No strand can be allotted more than max_reads
+            if len(heap) < max_reads:
+                heapq.heappush(heap, (key, read, x_start, x_end))
+            else:
+                heapq.heappushpop(heap, (key, read, x_start, x_end))
+            continue
+        
+        with decode_stage:
+            track = build_read_track(read, x_start, x_end, start_pos, end_pos, image_width, store)
+        if read.is_reverse:
+            reverse_tracks.append(track)
+        else:
+            forward_tracks.append(track)
     
-    # if method == 'downsample' and len(forward_tracks) + len(reverse_tracks) > max_reads:
-    #     # Randomly sample reads
-    #     all_reads = forward_tracks + reverse_tracks
-    #     sampled_indices = random.sample(range(len(all_reads)), max_reads)
-    #     sampled_reads = [all_reads[i] for i in sampled_indices]
-    #     forward_tracks = [r for r in sampled_reads if not r[3].is_reverse]
-    #     reverse_tracks = [r for r in sampled_reads if r[3].is_reverse]
+    if bam is not None and bam is not bam_path:
+        bam.close()
+    
+    if method == 'downsample':
+        # Decode only the sampled reads, in fetch order
+        reservoir.sort(key=lambda x: x[0])
+        with profiler.stage('collect.decode'):
+            for _, read, x_start, x_end in reservoir:
+                track = build_read_track(read, x_start, x_end, start_pos, end_pos, image_width, store)
+                if read.is_reverse:
+                    reverse_tracks.append(track)
+                else:
+                    forward_tracks.append(track)
         
-    if method == '3_end' and len(forward_tracks) + len(reverse_tracks) > max_reads:
-        # Sort by 3' end position
-        forward_tracks.sort(key=lambda x: x[1], reverse=True)
-        reverse_tracks.sort(key=lambda x: x[0])
-        forward_ratio = len(forward_tracks) / (len(forward_tracks) + len(reverse_tracks))
-        forward_max = int(max_reads * forward_ratio)
-        reverse_max = max_reads - forward_max
-        forward_tracks = forward_tracks[:forward_max]
-        reverse_tracks = reverse_tracks[:reverse_max]
+    elif method in ('3_end', '5_end'):
+        if forward_count + reverse_count > max_reads:
+            # Split max_reads by strand ratio and keep the best of each heap
+            forward_ratio = forward_count / (forward_count + reverse_count)
+            forward_max = int(max_reads * forward_ratio)
+            reverse_max = max_reads - forward_max
+            forward_selected = heapq.nlargest(forward_max, forward_heap)
+            reverse_selected = heapq.nlargest(reverse_max, reverse_heap)
+        else:
+            # Nothing to drop, keep fetch order
+            forward_selected = sorted(forward_heap, key=lambda x: -x[0][1])
+            reverse_selected = sorted(reverse_heap, key=lambda x: -x[0][1])
         
-    elif method == '5_end' and len(forward_tracks) + len(reverse_tracks) > max_reads:
-        # Sort by 5' end position
-        forward_tracks.sort(key=lambda x: x[0])
-        reverse_tracks.sort(key=lambda x: x[1], reverse=True)
-        # calculate the ratio of forward reads
-        forward_ratio = len(forward_tracks) / (len(forward_tracks) + len(reverse_tracks))
-        forward_max = int(max_reads * forward_ratio)
-        reverse_max = max_reads - forward_max
-        forward_tracks = forward_tracks[:forward_max]
-        reverse_tracks = reverse_tracks[:reverse_max]
+        with profiler.stage('collect.decode'):
+            for _, read, x_start, x_end in forward_selected:
+                forward_tracks.append(build_read_track(read, x_start, x_end, start_pos, end_pos, image_width, store))
+            for _, read, x_start, x_end in reverse_selected:
+                reverse_tracks.append(build_read_track(read, x_start, x_end, start_pos, end_pos, image_width, store))
         
     elif method == 'continuous':
-        packed_forward = []
-        packed_reverse = []
-        
-        for read in forward_tracks:
-            track = find_available_track_position(read[0], read[1], packed_forward)
-            packed_forward.append((read[0], read[1], track, read[3], read[4]))
-            
-        # Pack reverse reads
-        for read in reverse_tracks:
-            track = find_available_track_position(read[0], read[1], packed_reverse)
-            packed_reverse.append((read[0], read[1], track, read[3], read[4]))
-            
-        forward_tracks = packed_forward
-        reverse_tracks = packed_reverse
+        with profiler.stage('collect.pack'):
+            assign_track_rows(forward_tracks)
+            assign_track_rows(reverse_tracks)
     
     # Only sort if not using continuous method
     if method != 'continuous':
-        forward_tracks.sort(key=lambda x: x[0])
-        reverse_tracks.sort(key=lambda x: x[0])
+        forward_tracks.sort(key=lambda x: x.x_start)
+        reverse_tracks.sort(key=lambda x: x.x_start)
     
-    return forward_tracks, reverse_tracks 
\ No newline at end of file
+    profiler.count('reads.fetched', fetched_count)
+    profiler.count('reads.drawn', len(forward_tracks) + len(reverse_tracks))
+    profiler.count('blocks.drawn', len(store))
+    return forward_tracks, reverse_tracks
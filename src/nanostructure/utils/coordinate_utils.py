@@ -1,3 +1,5 @@
+import heapq
+
 def calculate_tick_interval(range_size):
     """Calculate appropriate tick interval based on genomic range size"""
     if range_size <= 1000:
@@ -19,4 +21,32 @@ def find_available_track_position(read_start, read_end, occupied_positions):
                 break
         if can_place:
             return track_pos
-        track_pos += 1 
\ No newline at end of file
+        track_pos += 1
+
+def assign_track_rows(records):
+    """Set ``row`` on each record (x_start/x_end/row) by first-fit packing
+    
+    Same placement as find_available_track_position. For records in
+    ascending x_start order a row becomes free for good once its last read
+    ends before the current start, so busy and free rows are kept in heaps
+    (O(n log n)) instead of rescanning every placed read for every row.
+    """
+    if any(a.x_start > b.x_start for a, b in zip(records, records[1:])):
+        occupied = []
+        for record in records:
+            record.row = find_available_track_position(record.x_start, record.x_end, occupied)
+            occupied.append((record.x_start, record.x_end, record.row))
+        return
+    
+    busy_rows = []  # (rightmost x_end, row)
+    free_rows = []
+    row_count = 0
+    for record in records:
+        while busy_rows and busy_rows[0][0] < record.x_start:
+            heapq.heappush(free_rows, heapq.heappop(busy_rows)[1])
+        if free_rows:
+            record.row = heapq.heappop(free_rows)
+        else:
+            record.row = row_count
+            row_count += 1
+        heapq.heappush(busy_rows, (record.x_end, record.row))
@@ -1,9 +1,16 @@
-from PIL import ImageFont
 from pathlib import Path
+from functools import lru_cache
 import math
 from ...config.colors import COLORS
 from ...config.coordinates import COORDINATES
 
+@lru_cache(maxsize=None)
+def load_font(font_size):
+    """Load the bundled label font, shared by every render in the process"""
+    from PIL import ImageFont
+    font_path = Path(__file__).parent.parent / 'fonts' / 'VeraMono.ttf'
+    return ImageFont.truetype(str(font_path), font_size)
+
 class BaseCoordinates:
     """Base class for coordinate handling"""
     
@@ -44,9 +51,11 @@ class BaseCoordinates:
     def set_font(self, font_size=12):
         """Set font for coordinate labels"""
         self.font_size = font_size
-        font_path = Path(__file__).parent.parent / 'fonts' / 'VeraMono.ttf'
-        self.font = ImageFont.truetype(str(font_path), font_size)
-        self.single_font_size = self.font.getsize('C')
+        self.font = load_font(font_size)
+        if hasattr(self.font, 'getsize'):
+            self.single_font_size = self.font.getsize('C')
+        else:  # Pillow >= 10 removed getsize, whose size is the bbox's right/bottom
+            self.single_font_size = self.font.getbbox('C')[2:]
 
     def calculate_ticks(self):
         """Calculate axis ticks and labels with improved spacing"""
@@ -1,7 +1,6 @@
 from ...config.colors import COLORS
 from ...config.coordinates import COORDINATES
 from .gene_coordinates import GeneCoordinates
-from .image_renderer import ImageRenderer
 
 class DrawingCoordinates(GeneCoordinates):
     """Handle coordinate drawing and rendering"""
@@ -13,9 +12,14 @@ class DrawingCoordinates(GeneCoordinates):
         self.exon_height = COORDINATES['dimensions']['exon_height']
         self.intron_height = COORDINATES['dimensions']['intron_height']
         self.margin = COORDINATES['margins']
+        self.gene_row_gap = COORDINATES['dimensions']['gene_row_gap']
+        self.max_gene_rows = COORDINATES['dimensions']['max_gene_rows']
+        # (inputs, layout) of the last _layout_gene_rows pass, see gene_row_layout
+        self._gene_rows = None
         
     def initialize_renderer(self):
         """Initialize the image renderer"""
+        from .image_renderer import ImageRenderer
         self.renderer = ImageRenderer(
             width=self.width,
             height=self.height,
@@ -49,41 +53,112 @@ class DrawingCoordinates(GeneCoordinates):
     def draw_gene_structure(self, yi):
         """Calculate gene structure drawing data
         
+        Transcripts that overlap on screen (including their labels) are
+        stacked on separate rows, at most ``max_gene_rows`` of them; when
+        transcripts are left out, one more label line below the rows holds
+        the ``+N transcripts not shown`` note (``omitted_transcripts``).
+        
         Args:
             yi: y-position of the coordinate axis
             
         Returns:
-            tuple: (dict, float) containing:
-                - dict: Drawing information for gene structure
+            tuple: (list, float) containing:
+                - list: Drawing information per transcript, empty without a
+                  gene model
                 - float: Y-end position of the gene structure
         """
-        if not self.gene_annotation:
-            return None, yi
+        rows, n_rows, omitted = self.gene_row_layout()
+        if not n_rows:
+            return [], yi
             
         gene_y = yi + self.LABEL_HEIGHT + self.GENE_STRUCTURE_MARGIN
-        gene_y_end = gene_y + self.exon_height
+        gene_y_end = gene_y + (n_rows - 1) * (self.exon_height + self.gene_row_gap) + self.exon_height
+        if omitted:
+            gene_y_end += self.gene_row_gap
         
-        print("\n=== draw_gene_structure called ===")
-        print(f"Gene drawing y start: {gene_y}")
-        print(f"Gene drawing y end: {gene_y_end}")
-
+        draw_data = [
+            self._transcript_draw_data(name, features, gene_y + row * (self.exon_height + self.gene_row_gap))
+            for row, name, features in rows
+        ]
+        return draw_data, gene_y_end
+    
+    def gene_structure_extra_height(self):
+        """Height taken by transcript rows beyond the first and the omitted note"""
+        _, n_rows, omitted = self.gene_row_layout()
+        return max(0, n_rows - 1) * (self.exon_height + self.gene_row_gap) + \
+            (self.gene_row_gap if omitted else 0)
+    
+    @property
+    def omitted_transcripts(self):
+        """Number of transcripts left out beyond ``max_gene_rows``"""
+        return self.gene_row_layout()[2]
+    
+    def gene_row_layout(self):
+        """Row layout of the gene models, computed once per model and scale
+        
+        Returns:
+            tuple: see ``_layout_gene_rows``
+        """
+        inputs = (self.gene_models, self.gene_annotation, self.transcript_id,
+                  self.xscale, self.start_pos, self.end_pos)
+        if self._gene_rows is None or any(a is not b for a, b in zip(inputs, self._gene_rows[0])):
+            self._gene_rows = (inputs, self._layout_gene_rows())
+        return self._gene_rows[1]
+    
+    def _layout_gene_rows(self):
+        """Assign each transcript a row, first-fit in screen space
+        
+        A transcript's label counts towards its width, at roughly 7px per
+        character.
+        
+        Returns:
+            tuple: (list of (row, name, features), number of rows, number of
+                transcripts left out because all ``max_gene_rows`` were full)
+        """
+        rows = []
+        row_ends = []
+        omitted = 0
+        for name, features in self.get_gene_models():
+            if not features:
+                continue
+            x1 = self.xscale.xmap[self._clamp(min(f['start'] for f in features))]['spos']
+            x2 = self.xscale.xmap[self._clamp(max(f['end'] for f in features))]['spos']
+            x_end = max(x2, x1 + len(name or '') * 7) + 10
+            for row, row_end in enumerate(row_ends):
+                if x1 > row_end:
+                    break
+            else:
+                row = len(row_ends)
+                if row == self.max_gene_rows:
+                    omitted += 1
+                    continue
+                row_ends.append(0)
+            row_ends[row] = x_end
+            rows.append((row, name, features))
+        return rows, len(row_ends), omitted
+    
+    def _clamp(self, pos):
+        return min(max(pos, self.start_pos), self.end_pos)
+    
+    def _transcript_draw_data(self, name, features, gene_y):
+        """Intron line, arrows and exon boxes of one transcript at gene_y"""
         draw_data = {
             'gene_y': gene_y,
             'intron_line': None,
             'exons': [],
             'strand': None,
-            'gene_name': self.transcript_id,
+            'gene_name': name,
             'style': COLORS['gene']
         }
         
-        if self.gene_annotation:
-            draw_data['strand'] = self.gene_annotation[0]['strand']
+        if features:
+            draw_data['strand'] = features[0]['strand']
         
-        if len(self.gene_annotation) > 0:
-            first_feature = min(self.gene_annotation, key=lambda x: x['start'])
-            last_feature = max(self.gene_annotation, key=lambda x: x['end'])
-            x1 = self.xscale.xmap[max(first_feature['start'], self.start_pos)]['spos']
-            x2 = self.xscale.xmap[min(last_feature['end'], self.end_pos)]['spos']
+        if len(features) > 0:
+            first_feature = min(features, key=lambda x: x['start'])
+            last_feature = max(features, key=lambda x: x['end'])
+            x1 = self.xscale.xmap[self._clamp(first_feature['start'])]['spos']
+            x2 = self.xscale.xmap[self._clamp(last_feature['end'])]['spos']
             
             arrow_points = []
             line_length = x2 - x1
@@ -118,7 +193,7 @@ class DrawingCoordinates(GeneCoordinates):
                 'label_position': (x1, gene_y - 5)
             }
         
-        for feature in self.gene_annotation:
+        for feature in features:
             if feature['start'] > self.end_pos or feature['end'] < self.start_pos:
                 continue
             
@@ -133,7 +208,7 @@ class DrawingCoordinates(GeneCoordinates):
                     'size': (x2 - x1, self.exon_height)
                 })
         
-        return draw_data, gene_y_end
+        return draw_data
         
     def calculate_track_start_y(self, gene_y):
         """Calculate the starting y position for read tracks"""
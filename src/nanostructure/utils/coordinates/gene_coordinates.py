@@ -1,5 +1,561 @@
+import hashlib
+import json
+import os
+import re
+import struct
+from bisect import bisect_right
+from pathlib import Path
+
+import numpy as np
+
 from .base_coordinates import BaseCoordinates
 
+def parse_attributes(attr_string):
+    """Parse attributes string flexibly supporting both GFF and GTF formats"""
+    attributes = {}
+    
+    if '=' in attr_string:  # GFF3 format
+        for attr in attr_string.split(';'):
+            if not attr.strip():
+                continue
+            if '=' in attr:
+                key, value = attr.strip().split('=', 1)
+                attributes[key] = value.strip('"')
+    else:  # GTF format
+        for attr in attr_string.split(';'):
+            if not attr.strip():
+                continue
+            try:
+                key, value = [x.strip() for x in attr.strip().split(' ', 1)]
+                attributes[key] = value.strip('"')
+            except ValueError:
+                continue
+    
+    return attributes
+
+# Transcript and gene identifiers of GTF (key "value") and GFF3 (key=value) attributes
+_GTF_ID_ATTRIBUTES = re.compile(r'(?:^|;)\s*(transcript_id|gene_id|gene_name) +([^;]*)')
+_GFF_ID_ATTRIBUTES = re.compile(r'(?:^|;)\s*(transcript_id|gene_id|gene_name|ID|Parent|Name)=([^;]*)')
+
+def parse_id_attributes(attr_string):
+    """Only the identifier attributes of an attributes string
+    
+    transcript_id, gene_id and gene_name, plus ID, Parent and Name for GFF3.
+    Same values as ``parse_attributes`` gives for these keys, without
+    splitting every other attribute of the line.
+    """
+    if '=' in attr_string:
+        return {key: value.strip('"') for key, value in _GFF_ID_ATTRIBUTES.findall(attr_string)}
+    return {key: value.strip().strip('"') for key, value in _GTF_ID_ATTRIBUTES.findall(attr_string)}
+
+def open_annotation(gtf_file):
+    """Open a GFF/GTF for reading text, plain or gzip/bgzip compressed"""
+    with open(gtf_file, 'rb') as f:
+        compressed = f.read(2) == b'\x1f\x8b'
+    if compressed:
+        import gzip
+        return gzip.open(gtf_file, 'rt')
+    return open(gtf_file)
+
+def has_tabix_index(gtf_file):
+    """Whether a bgzipped GFF/GTF has a .tbi or .csi index next to it"""
+    return os.path.exists(f"{gtf_file}.tbi") or os.path.exists(f"{gtf_file}.csi")
+
+def _parse_records(lines, contains=None):
+    """Yield (fields, id attributes) of feature lines, see parse_id_attributes
+    
+    Args:
+        contains (str, optional): Skip lines without this substring before
+            splitting them
+    """
+    for line in lines:
+        if contains is not None and contains not in line:
+            continue
+        if line.startswith('#'):
+            continue
+        fields = line.strip().split('\t')
+        if len(fields) < 9:
+            continue
+        yield fields, parse_id_attributes(fields[8])
+
+def _iter_records(gtf_file, contains=None):
+    """Yield (fields, id attributes) for every feature line of a GFF/GTF file"""
+    with open_annotation(gtf_file) as f:
+        yield from _parse_records(f, contains)
+
+def _location(fields):
+    return {'chrom': fields[0], 'start': int(fields[3]), 'end': int(fields[4])}
+
+def _feature(fields):
+    return {'type': fields[2], 'start': int(fields[3]), 'end': int(fields[4]), 'strand': fields[6]}
+
+def _read_transcript(gtf_file, transcript_id):
+    # One pass collects the location and the features; lines that cannot
+    # mention the transcript are dropped by a substring test before parsing
+    location = None
+    location_is_feature = False
+    features = []
+    for fields, attributes in _iter_records(gtf_file, contains=transcript_id):
+        is_transcript = attributes.get('transcript_id') == transcript_id
+        if (location is None or (location_is_feature and fields[2] not in ['exon', 'CDS'])) and \
+           (is_transcript or attributes.get('ID') == f'transcript:{transcript_id}'):
+            location = _location(fields)
+            location_is_feature = fields[2] in ['exon', 'CDS']
+        
+        if (is_transcript or attributes.get('Parent') == f'transcript:{transcript_id}') and \
+           fields[2] in ['exon', 'CDS']:
+            features.append(_feature(fields))
+    if location is not None:
+        # Span the features like AnnotationIndex does, so an exon-only
+        # annotation gives the whole transcript rather than its first exon
+        location['start'], location['end'] = _span(location, features)
+    return location, features
+
+def _collect_transcripts(records, transcript_ids=None, genes=None):
+    """Group (fields, attributes) records into {transcript_id: [location, features]}
+    
+    Args:
+        transcript_ids (set, optional): Only keep these transcripts
+        genes (dict, optional): Filled with gene key -> set of transcript IDs,
+            from GTF gene_id/gene_name or GFF3 ``gene:`` parents
+    """
+    index = {}
+    feature_locations = set()
+    members = {}  # gene_id -> transcript IDs
+    aliases = {}  # gene_id -> gene names
+    for fields, attributes in records:
+        transcript_id = attributes.get('transcript_id')
+        record_id = attributes.get('ID', '')
+        parent = attributes.get('Parent', '')
+        
+        location_id = transcript_id or (record_id[11:] if record_id.startswith('transcript:') else None)
+        if genes is not None:
+            gene_id = attributes.get('gene_id')
+            if record_id.startswith('gene:'):
+                names = aliases.setdefault(record_id[5:], set())
+                names.update(name for name in (gene_id, attributes.get('gene_name'), attributes.get('Name')) if name)
+            elif location_id is not None:
+                gene_id = parent[5:] if parent.startswith('gene:') else gene_id
+                if gene_id:
+                    members.setdefault(gene_id, set()).add(location_id)
+                    if attributes.get('gene_name'):
+                        aliases.setdefault(gene_id, set()).add(attributes['gene_name'])
+        if location_id is not None and (transcript_ids is None or location_id in transcript_ids):
+            entry = index.setdefault(location_id, [None, []])
+            # The transcript's own record wins over exons listed before it
+            if entry[0] is None or (location_id in feature_locations and fields[2] not in ['exon', 'CDS']):
+                entry[0] = _location(fields)
+                if fields[2] in ['exon', 'CDS']:
+                    feature_locations.add(location_id)
+                else:
+                    feature_locations.discard(location_id)
+        
+        feature_id = transcript_id or (parent[11:] if parent.startswith('transcript:') else None)
+        if feature_id is not None and fields[2] in ['exon', 'CDS'] and \
+           (transcript_ids is None or feature_id in transcript_ids):
+            index.setdefault(feature_id, [None, []])[1].append(_feature(fields))
+    
+    if genes is not None:
+        for gene_id, gene_transcripts in members.items():
+            keys = {gene_id, re.sub(r'\.\d+$', '', gene_id)} | aliases.get(gene_id, set())
+            for key in keys:
+                genes.setdefault(key, set()).update(gene_transcripts)
+    return index
+
+def read_transcript(gtf_file, transcript_id, cache_dir=None):
+    """Read a transcript's location and exon/CDS features from a GFF/GTF
+    
+    Answers from the file's ``AnnotationIndex`` when one is already loaded,
+    or cached in ``cache_dir``, otherwise scans the file for this transcript
+    only. Both return the same location.
+    
+    Returns:
+        tuple: (dict or None, list) chrom/start/end spanning the transcript's
+            own record and its features, and its exon/CDS features
+    """
+    index = load_annotation_index(gtf_file, cache_dir=cache_dir, build=False)
+    if index is not None:
+        return index.transcript(transcript_id)
+    return _read_transcript(gtf_file, transcript_id)
+
+_FEATURE_CODES = {'exon': 'e', 'CDS': 'c'}
+_FEATURE_TYPES = {code: feature_type for feature_type, code in _FEATURE_CODES.items()}
+
+def _span(location, features):
+    """Start and end of a transcript's own record and all of its features"""
+    return (min([location['start']] + [feature['start'] for feature in features]),
+            max([location['end']] + [feature['end'] for feature in features]))
+
+class AnnotationIndex:
+    """Transcripts of a GFF/GTF, for lookups by region, gene or transcript ID
+    
+    All transcripts live in flat NumPy arrays sorted by chromosome and start,
+    next to a per-chromosome running maximum of their ends. Both are
+    non-decreasing within a chromosome, so the transcripts overlapping a
+    region lie between two binary searches: O(log n + k) per lookup.
+    Transcript IDs and gene keys (gene_id with and without version, gene
+    name) are sorted string tables, offsets into a UTF-8 blob, searched the
+    same way. Nothing is rebuilt when loading, so an index written by
+    ``save`` is opened with ``np.memmap``: worker processes share its pages
+    through the page cache and load it in constant time.
+    """
+    VERSION = 3
+    MAGIC = b'NSIDX'
+    
+    def __init__(self, chroms, arrays):
+        """
+        Args:
+            chroms (dict): Chromosome -> (first, last) transcript positions
+            arrays (dict): Array name -> array, see ``from_transcripts``
+        """
+        self.chroms = chroms
+        self.arrays = arrays
+        # Chromosome of a transcript position, by bisecting the first positions
+        self._chrom_names = sorted(chroms, key=lambda chrom: chroms[chrom][0])
+        self._chrom_firsts = [chroms[chrom][0] for chrom in self._chrom_names]
+    
+    @classmethod
+    def from_transcripts(cls, transcripts, genes=None):
+        """Build the index from ``_collect_transcripts`` output
+        
+        A transcript spans its own record and all of its exon/CDS features.
+        
+        Args:
+            genes (dict, optional): Gene key -> set of transcript IDs, as
+                filled by ``_collect_transcripts``
+        """
+        entries = []
+        for transcript_id, (location, features) in transcripts.items():
+            if location is None:
+                continue
+            start, end = _span(location, features)
+            entries.append((location['chrom'], start, end, transcript_id, features))
+        entries.sort(key=lambda entry: entry[:4])
+        
+        chroms = {}
+        starts, ends, strands, ids = [], [], [], []
+        feature_offsets, feature_starts, feature_ends, feature_types = [0], [], [], []
+        for i, (chrom, start, end, transcript_id, features) in enumerate(entries):
+            first, _ = chroms.get(chrom, (i, i))
+            chroms[chrom] = (first, i + 1)
+            starts.append(start)
+            ends.append(end)
+            strands.append(features[0]['strand'][:1] if features else '.')
+            ids.append(transcript_id.encode())
+            for feature in sorted(features, key=lambda feature: (feature['start'], feature['end'])):
+                feature_starts.append(feature['start'])
+                feature_ends.append(feature['end'])
+                feature_types.append(_FEATURE_CODES[feature['type']])
+            feature_offsets.append(len(feature_starts))
+        
+        ends = np.array(ends, dtype=np.int64)
+        max_ends = ends.copy()
+        for first, last in chroms.values():
+            max_ends[first:last] = np.maximum.accumulate(ends[first:last])
+        
+        # Transcript IDs in position order, plus their positions in ID order
+        id_offsets, id_blob = _string_table(ids)
+        id_order = np.array(sorted(range(len(ids)), key=ids.__getitem__), dtype=np.int64)
+        
+        positions = {transcript_id: i for i, (_, _, _, transcript_id, _) in enumerate(entries)}
+        gene_keys, gene_members, gene_member_offsets = [], [], [0]
+        for key in sorted(genes or {}, key=lambda key: key.encode()):
+            members = sorted(positions[transcript_id] for transcript_id in genes[key]
+                             if transcript_id in positions)
+            if members:
+                gene_keys.append(key.encode())
+                gene_members.extend(members)
+                gene_member_offsets.append(len(gene_members))
+        gene_offsets, gene_blob = _string_table(gene_keys)
+        
+        arrays = {
+            'starts': np.array(starts, dtype=np.int64),
+            'ends': ends,
+            'max_ends': max_ends,
+            'strands': np.frombuffer(''.join(strands).encode(), dtype=np.uint8),
+            'feature_offsets': np.array(feature_offsets, dtype=np.int64),
+            'feature_starts': np.array(feature_starts, dtype=np.int64),
+            'feature_ends': np.array(feature_ends, dtype=np.int64),
+            'feature_types': np.frombuffer(''.join(feature_types).encode(), dtype=np.uint8),
+            'id_offsets': id_offsets,
+            'id_blob': id_blob,
+            'id_order': id_order,
+            'gene_offsets': gene_offsets,
+            'gene_blob': gene_blob,
+            'gene_member_offsets': np.array(gene_member_offsets, dtype=np.int64),
+            'gene_members': np.array(gene_members, dtype=np.int64),
+        }
+        return cls(chroms, arrays)
+    
+    def save(self, path, key):
+        """Write the index as a JSON header followed by 64-byte aligned arrays
+        
+        Args:
+            key (tuple): Annotation (size, mtime_ns) the index was built from
+        """
+        header = {'version': self.VERSION, 'key': list(key),
+                  'chroms': {chrom: list(span) for chrom, span in self.chroms.items()}, 'arrays': {}}
+        offset = 0
+        for name, values in self.arrays.items():
+            offset = _align(offset)
+            header['arrays'][name] = [values.dtype.str, list(values.shape), offset]
+            offset += values.nbytes
+        encoded = json.dumps(header).encode()
+        
+        with open(path, 'wb') as f:
+            f.write(self.MAGIC + struct.pack('<Q', len(encoded)) + encoded)
+            data_start = _align(f.tell())
+            for name, values in self.arrays.items():
+                f.seek(data_start + header['arrays'][name][2])
+                f.write(np.ascontiguousarray(values).tobytes())
+    
+    @classmethod
+    def load(cls, path, key):
+        """Memory-map an index written by ``save``
+        
+        Returns:
+            AnnotationIndex or None: None when the file is missing, of another
+                version or built from a different state of the annotation
+        """
+        try:
+            with open(path, 'rb') as f:
+                if f.read(len(cls.MAGIC)) != cls.MAGIC:
+                    return None
+                (length,) = struct.unpack('<Q', f.read(8))
+                header = json.loads(f.read(length))
+        except (OSError, ValueError, struct.error):
+            return None
+        if header['version'] != cls.VERSION or tuple(header['key']) != tuple(key):
+            return None
+        
+        data_start = _align(len(cls.MAGIC) + 8 + length)
+        buffer = np.memmap(path, dtype=np.uint8, mode='r')
+        arrays = {}
+        for name, (dtype, shape, offset) in header['arrays'].items():
+            dtype = np.dtype(dtype)
+            start = data_start + offset
+            count = int(np.prod(shape, dtype=np.int64))
+            arrays[name] = buffer[start:start + count * dtype.itemsize].view(dtype).reshape(shape)
+        return cls({chrom: tuple(span) for chrom, span in header['chroms'].items()}, arrays)
+    
+    def _chrom(self, chrom):
+        # Accept 'chr1' for an annotation using '1' and vice versa
+        if chrom in self.chroms:
+            return chrom
+        alias = chrom[3:] if chrom.startswith('chr') else f'chr{chrom}'
+        return alias if alias in self.chroms else None
+    
+    def overlapping(self, chrom, start, end):
+        """Transcripts overlapping ``chrom:start-end`` (1-based, inclusive)
+        
+        Returns:
+            list: (transcript_id, features) tuples ordered by transcript start,
+                features being exon/CDS dicts as returned by ``read_transcript``
+        """
+        chrom = self._chrom(chrom)
+        if chrom is None:
+            return []
+        first, last = self.chroms[chrom]
+        arrays = self.arrays
+        low = first + int(np.searchsorted(arrays['max_ends'][first:last], start, 'left'))
+        high = first + int(np.searchsorted(arrays['starts'][first:last], end, 'right'))
+        return [self._transcript(i) for i in range(low, high) if arrays['ends'][i] >= start]
+    
+    def gene(self, name):
+        """Location and transcripts of a gene, by gene_id (versioned or not) or name
+        
+        A name found on several chromosomes resolves to the first of them.
+        
+        Returns:
+            tuple: (dict or None, list) chrom/start/end spanning the gene's
+                transcripts, and their (transcript_id, features) ordered by start
+        """
+        arrays = self.arrays
+        j = _find_string(arrays['gene_offsets'], arrays['gene_blob'], name)
+        if j is None:
+            return None, []
+        members = arrays['gene_members'][arrays['gene_member_offsets'][j]:arrays['gene_member_offsets'][j + 1]]
+        chrom = self._chrom_of(int(members[0]))
+        first, last = self.chroms[chrom]
+        members = [int(i) for i in members if first <= i < last]
+        location = {
+            'chrom': chrom,
+            'start': min(int(arrays['starts'][i]) for i in members),
+            'end': max(int(arrays['ends'][i]) for i in members),
+        }
+        return location, [self._transcript(i) for i in members]
+    
+    def transcript(self, transcript_id):
+        """Location and exon/CDS features of one transcript, as ``read_transcript``"""
+        arrays = self.arrays
+        k = _find_string(arrays['id_offsets'], arrays['id_blob'], transcript_id, arrays['id_order'])
+        if k is None:
+            return None, []
+        i = int(arrays['id_order'][k])
+        location = {'chrom': self._chrom_of(i), 'start': int(arrays['starts'][i]), 'end': int(arrays['ends'][i])}
+        return location, self._transcript(i)[1]
+    
+    def _chrom_of(self, i):
+        return self._chrom_names[bisect_right(self._chrom_firsts, i) - 1]
+    
+    def _transcript(self, i):
+        arrays = self.arrays
+        strand = chr(arrays['strands'][i])
+        first, last = int(arrays['feature_offsets'][i]), int(arrays['feature_offsets'][i + 1])
+        features = [
+            {'type': _FEATURE_TYPES[chr(code)], 'start': start, 'end': end, 'strand': strand}
+            for code, start, end in zip(arrays['feature_types'][first:last].tolist(),
+                                        arrays['feature_starts'][first:last].tolist(),
+                                        arrays['feature_ends'][first:last].tolist())
+        ]
+        return _table_string(arrays['id_offsets'], arrays['id_blob'], i), features
+
+def _align(offset, alignment=64):
+    return -(-offset // alignment) * alignment
+
+def _string_table(strings):
+    """Offsets and concatenated bytes of a list of encoded strings"""
+    offsets = np.zeros(len(strings) + 1, dtype=np.int64)
+    np.cumsum([len(string) for string in strings], out=offsets[1:])
+    return offsets, np.frombuffer(b''.join(strings), dtype=np.uint8)
+
+def _table_string(offsets, blob, i):
+    return blob[offsets[i]:offsets[i + 1]].tobytes().decode()
+
+def _find_string(offsets, blob, value, order=None):
+    """Position of value in a string table sorted by bytes (or in ``order``)"""
+    target = value.encode()
+    low, high = 0, len(offsets) - 1
+    while low < high:
+        middle = (low + high) // 2
+        i = middle if order is None else order[middle]
+        if blob[offsets[i]:offsets[i + 1]].tobytes() < target:
+            low = middle + 1
+        else:
+            high = middle
+    if low < len(offsets) - 1:
+        i = low if order is None else order[low]
+        if blob[offsets[i]:offsets[i + 1]].tobytes() == target:
+            return low
+    return None
+
+def _tabix_contig(tbx, chrom):
+    if chrom in tbx.contigs:
+        return chrom
+    alias = chrom[3:] if chrom.startswith('chr') else f'chr{chrom}'
+    return alias if alias in tbx.contigs else None
+
+def read_region_transcripts(gtf_file, chrom, start, end):
+    """Transcripts overlapping a region of a bgzipped, tabix-indexed GFF/GTF
+    
+    Only the region is decompressed: a first query finds the overlapping
+    transcripts, a second one over their combined span collects the
+    features that lie outside the region.
+    
+    Returns:
+        list: (transcript_id, features) tuples, as ``AnnotationIndex.overlapping``
+    """
+    import pysam
+    
+    with pysam.TabixFile(gtf_file) as tbx:
+        contig = _tabix_contig(tbx, chrom)
+        if contig is None:
+            return []
+        transcripts = _collect_transcripts(_parse_records(tbx.fetch(contig, max(0, start - 1), end)))
+        hits = AnnotationIndex.from_transcripts(transcripts).overlapping(contig, start, end)
+        if not hits:
+            return []
+        
+        transcript_ids = {transcript_id for transcript_id, _ in hits}
+        spans = [_span(*transcripts[transcript_id]) for transcript_id in transcript_ids]
+        span_start = min(span[0] for span in spans)
+        span_end = max(span[1] for span in spans)
+        if span_start < start or span_end > end:
+            transcripts = _collect_transcripts(
+                _parse_records(tbx.fetch(contig, max(0, span_start - 1), span_end)),
+                transcript_ids=transcript_ids
+            )
+    return AnnotationIndex.from_transcripts(transcripts).overlapping(contig, start, end)
+
+# Parsed annotations by absolute path, each with the (size, mtime_ns) it was
+# built from; the oldest is dropped past _MAX_ANNOTATION_INDEXES files
+_annotation_indexes = {}
+_MAX_ANNOTATION_INDEXES = 8
+
+def _annotation_cache_path(gtf_file, cache_dir):
+    digest = hashlib.sha1(os.path.abspath(gtf_file).encode()).hexdigest()
+    return Path(cache_dir).expanduser() / f"{digest}.nsidx"
+
+def load_annotation_index(gtf_file, cache_dir=None, build=True):
+    """Index of a GFF/GTF, kept in memory and optionally cached on disk
+    
+    The index is reused while the annotation's size and mtime are unchanged.
+    With ``cache_dir`` it is also written there as a binary file and
+    memory-mapped, so later runs and other processes opening the same file
+    share its pages; without one nothing is written to disk. An unwritable
+    ``cache_dir`` only costs the disk cache.
+    
+    Args:
+        build (bool): Parse the annotation when no valid index is loaded or
+            cached, otherwise return None
+    
+    Returns:
+        AnnotationIndex or None
+    """
+    path = os.path.abspath(gtf_file)
+    stat = os.stat(path)
+    key = (stat.st_size, stat.st_mtime_ns)
+    cached = _annotation_indexes.get(path)
+    if cached and cached[0] == key:
+        return cached[1]
+    
+    cache_path = None if cache_dir is None else _annotation_cache_path(path, cache_dir)
+    index = None if cache_path is None else AnnotationIndex.load(cache_path, key)
+    if index is None:
+        if not build:
+            return None
+        # Parsed without keeping the dicts, the arrays replace them
+        genes = {}
+        index = AnnotationIndex.from_transcripts(_collect_transcripts(_iter_records(path), genes=genes), genes)
+        if cache_path is not None:
+            try:
+                cache_path.parent.mkdir(parents=True, exist_ok=True)
+                # Write then rename so concurrent readers never see a partial index
+                tmp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+                index.save(tmp_path, key)
+                os.replace(tmp_path, cache_path)
+                # Switch to the mapped copy, which forked workers then share
+                index = AnnotationIndex.load(cache_path, key) or index
+            except OSError:
+                pass
+    
+    _annotation_indexes.pop(path, None)
+    _annotation_indexes[path] = (key, index)
+    while len(_annotation_indexes) > _MAX_ANNOTATION_INDEXES:
+        del _annotation_indexes[next(iter(_annotation_indexes))]
+    return index
+
+def collapse_transcripts(transcripts):
+    """Merge the exons (and CDS) of several transcripts into one model
+    
+    Returns:
+        list: Features covering the union of the transcripts' features of
+            each type, ordered by start
+    """
+    merged = []
+    for feature_type in _FEATURE_CODES:
+        intervals = sorted((feature['start'], feature['end'], feature['strand'])
+                           for _, features in transcripts for feature in features
+                           if feature['type'] == feature_type)
+        current = None
+        for start, end, strand in intervals:
+            if current is not None and start <= current['end'] + 1:
+                current['end'] = max(current['end'], end)
+                continue
+            current = {'type': feature_type, 'start': start, 'end': end, 'strand': strand}
+            merged.append(current)
+    return sorted(merged, key=lambda feature: (feature['start'], feature['end']))
+
 class GeneCoordinates(BaseCoordinates):
     """Handle gene structure and annotation"""
     
@@ -7,103 +563,76 @@ class GeneCoordinates(BaseCoordinates):
         super().__init__(*args, **kwargs)
         self.transcript_id = None
         self.gene_annotation = None
+        self.gene_models = None
         self.exon_height = 20
         self.intron_height = 2
 
-    def set_gene_annotation(self, gtf_file):
+    def set_gene_annotation(self, gtf_file, cache_dir=None):
         """Set gene annotation from GTF file"""
-        self.gene_annotation = self._parse_gtf_file(gtf_file)
-
-    def _parse_gtf_file(self, gtf_file):
-        features = []
-        with open(gtf_file) as f:
-            for line in f:
-                if line.startswith('#'):
-                    continue
-                fields = line.strip().split('\t')
-                if len(fields) < 9:
-                    continue
-                    
-                feature_type = fields[2]
-                start = int(fields[3])
-                end = int(fields[4])
-                strand = fields[6]
-                
-                attributes = self._parse_attributes(fields[8])
-                
-                if ('transcript_id' in attributes and attributes['transcript_id'] == self.transcript_id) or \
-                   ('Parent' in attributes and attributes['Parent'] == f'transcript:{self.transcript_id}'):
-                    
-                    if feature_type in ['exon', 'CDS']:
-                        features.append({
-                            'type': feature_type,
-                            'start': start,
-                            'end': end,
-                            'strand': strand
-                        })
-        return features
+        self.gene_annotation = self._parse_gtf_file(gtf_file, cache_dir=cache_dir)
+
+    def set_region_annotation(self, gtf_file, chrom, start, end, cache_dir=None):
+        """Use every transcript overlapping a region as the gene model
+        
+        A bgzipped annotation with a tabix index is queried for the region
+        only, any other is indexed whole (see ``load_annotation_index``).
+        
+        Args:
+            cache_dir (str, optional): Where the binary annotation index is
+                cached, kept in memory only when not given
+        """
+        if has_tabix_index(gtf_file):
+            self.gene_models = read_region_transcripts(gtf_file, chrom, start, end)
+        else:
+            index = load_annotation_index(gtf_file, cache_dir=cache_dir)
+            self.gene_models = index.overlapping(chrom, start, end)
+
+    def get_gene_models(self):
+        """Transcripts to draw as (name, features) tuples"""
+        if self.gene_models is not None:
+            return self.gene_models
+        if self.gene_annotation:
+            return [(self.transcript_id, self.gene_annotation)]
+        return []
+
+    def _parse_gtf_file(self, gtf_file, cache_dir=None):
+        return read_transcript(gtf_file, self.transcript_id, cache_dir=cache_dir)[1]
 
     def _parse_attributes(self, attr_string):
         """Parse attributes string flexibly supporting both GFF and GTF formats"""
-        attributes = {}
-        
-        if '=' in attr_string:  # GFF3 format
-            for attr in attr_string.split(';'):
-                if not attr.strip():
-                    continue
-                if '=' in attr:
-                    key, value = attr.strip().split('=', 1)
-                    attributes[key] = value.strip('"')
-        else:  # GTF format
-            for attr in attr_string.split(';'):
-                if not attr.strip():
-                    continue
-                try:
-                    key, value = [x.strip() for x in attr.strip().split(' ', 1)]
-                    attributes[key] = value.strip('"')
-                except ValueError:
-                    continue
-        
-        return attributes
-
-    def get_transcript_coordinates(self, gtf_file, transcript_id):
-        """Extract transcript coordinates from GFF/GTF file"""
+        return parse_attributes(attr_string)
+
+    def get_transcript_coordinates(self, gtf_file, transcript_id, cache_dir=None):
+        """Extract transcript coordinates from GFF/GTF file
+        
+        The transcript's features read in the same lookup become the gene
+        annotation, see ``set_gene_annotation``.
+        
+        Args:
+            cache_dir (str, optional): Where a binary annotation index may be
+                cached
+        """
         self.transcript_id = transcript_id
         
-        with open(gtf_file) as f:
-            for line in f:
-                if line.startswith('#'):
-                    continue
-                fields = line.strip().split('\t')
-                if len(fields) < 9:
-                    continue
-                
-                attributes = self._parse_attributes(fields[8])
-                
-                found_transcript = False
-                if 'transcript_id' in attributes and attributes['transcript_id'] == transcript_id:
-                    found_transcript = True
-                elif 'ID' in attributes and attributes['ID'] == f'transcript:{transcript_id}':
-                    found_transcript = True
-                
-                if found_transcript:
-                    self.chrom = fields[0]
-                    self.start_pos = int(fields[3])
-                    self.end_pos = int(fields[4])
-                    return {
-                        'chrom': self.chrom,
-                        'start': self.start_pos,
-                        'end': self.end_pos
-                    }
-        
-        raise ValueError(f"Transcript {transcript_id} not found in GFF/GTF file") 
-
-    def get_gene_coordinates(self, gtf_file, gene_name):
-        """Extract gene coordinates from GTF file
+        location, self.gene_annotation = read_transcript(gtf_file, transcript_id, cache_dir=cache_dir)
+        if location is None:
+            raise ValueError(f"Transcript {transcript_id} not found in GFF/GTF file")
+        
+        self.chrom = location['chrom']
+        self.start_pos = location['start']
+        self.end_pos = location['end']
+        return location
+
+    def get_gene_coordinates(self, gtf_file, gene_name, isoforms='stacked', cache_dir=None):
+        """Extract gene coordinates from GTF file and use its isoforms as the gene model
         
         Args:
             gtf_file (str): Path to GTF file
-            gene_name (str): Name of the gene to find
+            gene_name (str): gene_id (with or without version) or gene name
+            isoforms (str): 'stacked' draws every transcript on its own row,
+                'collapsed' draws the union of their exons as one model
+            cache_dir (str, optional): Where the binary annotation index is
+                cached, kept in memory only when not given
             
         Returns:
             dict: Dictionary containing chromosome, start and end positions
@@ -111,13 +640,22 @@ class GeneCoordinates(BaseCoordinates):
         Raises:
             ValueError: If gene is not found in GTF file
         """
-        from ..parsers.gtf_parser import GTFParser
-        parser = GTFParser(debug=self.debug)
-        gene_info = parser.parse_gene(gtf_file, gene_name)
+        if isoforms not in ('stacked', 'collapsed'):
+            raise ValueError('isoforms must be one of: "stacked", "collapsed"')
+        
+        location, transcripts = load_annotation_index(gtf_file, cache_dir=cache_dir).gene(gene_name)
+        if location is None:
+            raise ValueError(f"Gene {gene_name} not found in GFF/GTF file")
+        
+        self.transcript_id = gene_name
+        if isoforms == 'collapsed':
+            self.gene_models = [(gene_name, collapse_transcripts(transcripts))]
+        else:
+            self.gene_models = transcripts
         
         # Update instance variables
-        self.chrom = gene_info['chrom']
-        self.start_pos = gene_info['start']
-        self.end_pos = gene_info['end']
+        self.chrom = location['chrom']
+        self.start_pos = location['start']
+        self.end_pos = location['end']
         
-        return gene_info 
\ No newline at end of file
+        return location 
\ No newline at end of file
@@ -0,0 +1,85 @@
+import numpy as np
+
+
+class CoverageTrack:
+    """Per-base depth and mismatch counts accumulated during the read fetch
+
+    Reads are added one by one from the same ``bam.fetch`` loop that builds
+    the read tracks, so the coverage costs no extra BAM pass. Block bounds
+    and mismatch positions are only collected while streaming; the per-base
+    arrays are built in one vectorised ``np.add.at`` pass by ``finalize``.
+    """
+
+    def __init__(self, start_pos, end_pos, mismatch_threshold=0.2):
+        self.start_pos = start_pos
+        self.end_pos = end_pos
+        self.mismatch_threshold = mismatch_threshold
+
+        self._block_starts = []
+        self._block_ends = []
+        self._mismatches = []
+
+        self.depth = None
+        self.mismatches = None
+
+    def add_blocks(self, aligned_blocks, mismatch_positions):
+        """Add one read given its aligned (start, end) blocks and mismatch positions"""
+        for block_start, block_end in aligned_blocks:
+            self._block_starts.append(block_start)
+            self._block_ends.append(block_end)
+        self._mismatches.extend(mismatch_positions)
+
+    def finalize(self):
+        """Build per-base depth and mismatch arrays for the region"""
+        length = self.end_pos - self.start_pos
+
+        # Difference array: +1 at each block start, -1 at each block end
+        diff = np.zeros(length + 1, dtype=np.int64)
+        starts = np.clip(np.asarray(self._block_starts, dtype=np.int64) - self.start_pos, 0, length)
+        ends = np.clip(np.asarray(self._block_ends, dtype=np.int64) - self.start_pos, 0, length)
+        np.add.at(diff, starts, 1)
+        np.add.at(diff, ends, -1)
+        self.depth = np.cumsum(diff[:-1])
+
+        self.mismatches = np.zeros(length, dtype=np.int64)
+        positions = np.asarray(self._mismatches, dtype=np.int64) - self.start_pos
+        positions = positions[(positions >= 0) & (positions < length)]
+        np.add.at(self.mismatches, positions, 1)
+
+        self._block_starts, self._block_ends, self._mismatches = [], [], []
+        return self
+
+    def get_render_data(self, image_width):
+        """Bin per-base coverage to pixel columns
+
+        Returns:
+            dict: with 'bars' as a list of (x_start, x_end, depth, mismatch_fraction)
+                and 'max_depth'. Depth is the maximum within the column and
+                mismatch_fraction is only set when it exceeds the threshold.
+        """
+        if self.depth is None:
+            self.finalize()
+
+        length = len(self.depth)
+        if length == 0:
+            return {'bars': [], 'max_depth': 0}
+
+        # Same truncating base -> pixel mapping as the read tracks
+        bins = (np.arange(length) * image_width / length).astype(np.int64)
+        x_starts, first_index = np.unique(bins, return_index=True)
+        x_ends = np.append(x_starts[1:], image_width)
+
+        depth_max = np.maximum.reduceat(self.depth, first_index)
+        depth_sum = np.add.reduceat(self.depth, first_index)
+        mismatch_sum = np.add.reduceat(self.mismatches, first_index)
+        fraction = np.divide(mismatch_sum, depth_sum,
+                             out=np.zeros(len(depth_sum), dtype=float),
+                             where=depth_sum > 0)
+        fraction[fraction < self.mismatch_threshold] = 0
+
+        bars = [
+            (int(x_start), int(x_end), int(depth), float(frac))
+            for x_start, x_end, depth, frac in zip(x_starts, x_ends, depth_max, fraction)
+            if depth > 0
+        ]
+        return {'bars': bars, 'max_depth': int(depth_max.max())}
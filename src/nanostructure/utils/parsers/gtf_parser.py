@@ -1,5 +1,7 @@
 import tqdm
 
+from ..coordinates.gene_coordinates import open_annotation
+
 class GTFParser:
     """Parse GTF/GFF files"""
     
@@ -34,9 +36,10 @@ class GTFParser:
 
     def parse_gene(self, gtf_file, gene_name):
         """Extract gene coordinates from GTF file"""
-        with open(gtf_file) as f:
+        with open_annotation(gtf_file) as f:
             for line in tqdm.tqdm(f, desc="Parsing GTF file"):
-                if line.startswith('#'):
+                # Cheap substring test before splitting and parsing the line
+                if gene_name not in line or line.startswith('#'):
                     continue
                 fields = line.strip().split('\t')
                 if len(fields) < 9:
@@ -61,9 +64,10 @@ class GTFParser:
         features = []
         transcript_info = None
         
-        with open(gtf_file) as f:
+        with open_annotation(gtf_file) as f:
             for line in tqdm.tqdm(f, desc="Parsing GTF file"):
-                if line.startswith('#'):
+                # Cheap substring test before splitting and parsing the line
+                if transcript_id not in line or line.startswith('#'):
                     continue
                 fields = line.strip().split('\t')
                 if len(fields) < 9:
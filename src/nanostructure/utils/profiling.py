@@ -0,0 +1,180 @@
+import json
+import threading
+import time
+
+
+class _Stage:
+    """Context manager adding its wall time to one stage of a StageProfiler"""
+    __slots__ = ('profiler', 'name', 'start')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler._register(self.name)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.add_time(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class NullProfiler:
+    """Profiler that records nothing, the default of every profiling hook"""
+    enabled = False
+
+    def stage(self, name):
+        return _NULL_STAGE
+
+    def add_time(self, name, seconds):
+        pass
+
+    def count(self, name, n=1):
+        pass
+
+    def profile(self):
+        return _NULL_STAGE
+
+
+NULL_PROFILER = NullProfiler()
+
+
+class StageProfiler:
+    """Wall time per render stage plus counts of reads, blocks and SVG elements
+
+    Stages are named with dots for nesting (``collect``, ``collect.decode``);
+    a nested stage's time is included in its parent. A stage entered several
+    times (per read, per panel) accumulates its time and number of calls, and
+    stages timed in concurrent threads add up their wall times.
+
+    Usage:
+        profiler = StageProfiler(cprofile=True)
+        render_alignment_snapshot(bam, position='chr1:1000-5000', profiler=profiler)
+        print(profiler.format())
+        profiler.write_json('snapshot.profile.json')
+    """
+    enabled = True
+
+    def __init__(self, cprofile=False, top_functions=25):
+        """
+        Args:
+            cprofile (bool): Also capture a cProfile of the render (main thread
+                only) and report its top functions by cumulative time
+            top_functions (int): Number of cProfile functions reported
+        """
+        self.stages = {}
+        self.counts = {}
+        self.total_seconds = 0.0
+        self.top_functions = top_functions
+        self._cprofile = None
+        if cprofile:
+            import cProfile
+            self._cprofile = cProfile.Profile()
+        self._lock = threading.Lock()
+
+    def stage(self, name):
+        """Context manager timing one stage"""
+        return _Stage(self, name)
+
+    def add_time(self, name, seconds):
+        with self._lock:
+            entry = self.stages.setdefault(name, {'seconds': 0.0, 'calls': 0})
+            entry['seconds'] += seconds
+            entry['calls'] += 1
+
+    def _register(self, name):
+        # Stages are listed in the order they are first entered, parents first
+        if name not in self.stages:
+            with self._lock:
+                self.stages.setdefault(name, {'seconds': 0.0, 'calls': 0})
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + n
+
+    def profile(self):
+        """Context manager around a whole render: total time and cProfile capture"""
+        return _Profile(self)
+
+    def report(self):
+        """Return the breakdown as a JSON-serialisable dict"""
+        report = {
+            'total_seconds': self.total_seconds,
+            'stages': {name: dict(entry) for name, entry in self.stages.items()},
+            'counts': dict(sorted(self.counts.items())),
+        }
+        if self._cprofile is not None:
+            report['functions'] = self._top_functions()
+        return report
+
+    def format(self):
+        """Human-readable breakdown table"""
+        lines = [f"{'stage':<28}{'seconds':>10}{'share':>8}{'calls':>9}"]
+        for name, entry in self.stages.items():
+            depth = name.count('.')
+            label = '  ' * depth + name.rsplit('.', 1)[-1]
+            share = entry['seconds'] / self.total_seconds if self.total_seconds else 0
+            lines.append(f"{label:<28}{entry['seconds']:>10.4f}{share:>8.1%}{entry['calls']:>9}")
+        lines.append(f"{'total':<28}{self.total_seconds:>10.4f}")
+        if self.counts:
+            lines.append('')
+            lines.extend(f"{name:<28}{count:>10}" for name, count in sorted(self.counts.items()))
+        if self._cprofile is not None:
+            lines.append('')
+            lines.append(f"{'cumulative s':>12}{'calls':>10}  function")
+            lines.extend(f"{item['cumulative_seconds']:>12.4f}{item['calls']:>10}  {item['function']}"
+                         for item in self._top_functions())
+        return '\n'.join(lines)
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+
+    def _top_functions(self):
+        import pstats
+
+        stats = pstats.Stats(self._cprofile).stats
+        rows = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)
+        return [
+            {
+                'function': f"{filename}:{line}({name})",
+                'calls': calls,
+                'total_seconds': total,
+                'cumulative_seconds': cumulative,
+            }
+            for (filename, line, name), (_, calls, total, cumulative, _) in rows[:self.top_functions]
+        ]
+
+
+class _Profile:
+    __slots__ = ('profiler', 'start')
+
+    def __init__(self, profiler):
+        self.profiler = profiler
+
+    def __enter__(self):
+        if self.profiler._cprofile is not None:
+            self.profiler._cprofile.enable()
+        self.start = time.perf_counter()
+        return self.profiler
+
+    def __exit__(self, *exc):
+        self.profiler.total_seconds += time.perf_counter() - self.start
+        if self.profiler._cprofile is not None:
+            self.profiler._cprofile.disable()
+        return False
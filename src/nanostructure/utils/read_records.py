@@ -0,0 +1,94 @@
+from array import array
+
+# Block operation types, stored as their index in this tuple
+BLOCK_TYPES = ('match', 'mismatch', 'insertion', 'deletion', 'skip', 'soft_clip', 'hard_clip')
+BLOCK_CODES = {op_type: code for code, op_type in enumerate(BLOCK_TYPES)}
+
+
+class BlockStore:
+    """Flat arrays holding the image blocks of every read in one render
+
+    Each block costs 9 bytes (two int32 pixel bounds and one op code) instead
+    of a Python tuple per block.
+    """
+    __slots__ = ('starts', 'ends', 'codes')
+
+    def __init__(self):
+        self.starts = array('i')
+        self.ends = array('i')
+        self.codes = array('B')
+
+    def __len__(self):
+        return len(self.codes)
+
+    def append(self, image_blocks):
+        """Append (x_start, x_end, op_type) blocks and return their offset"""
+        offset = len(self.codes)
+        for block_start, block_end, op_type in image_blocks:
+            self.starts.append(block_start)
+            self.ends.append(block_end)
+            self.codes.append(BLOCK_CODES[op_type])
+        return offset
+
+    def get(self, offset, count):
+        """Return blocks [offset, offset + count) as (x_start, x_end, op_type) tuples"""
+        end = offset + count
+        return [
+            (block_start, block_end, BLOCK_TYPES[code])
+            for block_start, block_end, code in zip(
+                self.starts[offset:end], self.ends[offset:end], self.codes[offset:end])
+        ]
+
+
+class ReadRecord:
+    """Compact read track: pixel span, strand, row and a slice of a BlockStore
+
+    Replaces the (x_start, x_end, row, read, blocks) tuples, which kept the
+    whole pysam.AlignedSegment (sequence, qualities, tags) alive for the
+    duration of rendering although only its strand is ever used.
+    """
+    __slots__ = ('x_start', 'x_end', 'row', 'is_reverse', 'block_offset', 'block_count', 'store')
+
+    def __init__(self, x_start, x_end, is_reverse, store, image_blocks, row=0):
+        self.x_start = x_start
+        self.x_end = x_end
+        self.row = row
+        self.is_reverse = is_reverse
+        self.store = store
+        self.block_offset = store.append(image_blocks)
+        self.block_count = len(store) - self.block_offset
+
+    @property
+    def blocks(self):
+        """list of (x_start, x_end, op_type) tuples"""
+        return self.store.get(self.block_offset, self.block_count)
+
+    def __repr__(self):
+        strand = '-' if self.is_reverse else '+'
+        return (f"ReadRecord({self.x_start}-{self.x_end}, {strand}, row={self.row}, "
+                f"blocks={self.block_count})")
+
+
+class DecodedRead:
+    """Decoded alignment in genomic coordinates, independent of image width
+
+    Holds what the snapshot pipeline needs from a pysam.AlignedSegment:
+    its span and strand, the exon blocks from ``find_exon_blocks`` and the
+    coverage inputs (aligned blocks and mismatch positions). Used by the
+    tile cache so re-renders skip BAM decoding altogether.
+    """
+    __slots__ = ('reference_start', 'reference_end', 'is_reverse',
+                 'exon_blocks', 'aligned_blocks', 'mismatches')
+
+    def __init__(self, reference_start, reference_end, is_reverse,
+                 exon_blocks, aligned_blocks, mismatches):
+        self.reference_start = reference_start
+        self.reference_end = reference_end
+        self.is_reverse = is_reverse
+        self.exon_blocks = exon_blocks
+        self.aligned_blocks = aligned_blocks
+        self.mismatches = mismatches
+
+    def __reduce__(self):
+        return (DecodedRead, (self.reference_start, self.reference_end, self.is_reverse,
+                              self.exon_blocks, self.aligned_blocks, self.mismatches))
@@ -0,0 +1,128 @@
+import hashlib
+import os
+import threading
+from pathlib import Path
+
+import pysam
+
+# Bases read from the FASTA at a time while filling the cache
+CHUNK_SIZE = 1 << 22
+
+# reference FASTA key -> {contig: M5 digest} of the contigs cached so far
+_cached_digests = {}
+_lock = threading.Lock()
+
+
+def cache_pattern(cache_dir):
+    """htslib REF_CACHE/REF_PATH pattern for sequences stored under cache_dir"""
+    return os.path.join(os.path.abspath(cache_dir), '%2s', '%2s', '%s')
+
+
+def _sequence_path(cache_dir, digest):
+    return Path(cache_dir) / digest[:2] / digest[2:4] / digest[4:]
+
+
+def _read_manifest(manifest, cache_dir):
+    """Contig -> digest entries of a manifest whose sequence files still exist"""
+    digests = {}
+    try:
+        with open(manifest) as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) == 2 and _sequence_path(cache_dir, fields[1]).exists():
+                    digests[fields[0]] = fields[1]
+    except OSError:
+        pass
+    return digests
+
+
+def populate_reference_cache(reference, cache_dir, contigs):
+    """Copy contigs of an indexed FASTA into an htslib reference cache
+
+    Sequences are stored upper-cased and without line breaks under their MD5
+    (the CRAM ``@SQ M5`` value), in the ``REF_CACHE`` layout htslib memory
+    maps, so CRAM slices are decoded without reading the FASTA again. Only
+    the requested contigs are copied, each the first time it is asked for;
+    a manifest keyed by the FASTA's path, size and mtime lists the contigs
+    already cached.
+
+    Args:
+        reference (str): FASTA file with a .fai index, plain or bgzip-compressed
+        cache_dir (str): Directory holding the cached sequences
+        contigs (list of str): FASTA sequences about to be decoded against
+
+    Returns:
+        dict: Contig -> MD5 digest of the requested contigs found in the FASTA
+    """
+    stat = os.stat(reference)
+    key = (os.path.abspath(reference), stat.st_size, stat.st_mtime_ns, os.path.abspath(cache_dir))
+    with _lock:
+        cache_dir = Path(cache_dir)
+        manifest = cache_dir / f"{hashlib.sha1(repr(key[:3]).encode()).hexdigest()}.m5"
+        digests = _cached_digests.get(key)
+        if digests is None:
+            digests = _cached_digests[key] = _read_manifest(manifest, cache_dir)
+
+        missing = [contig for contig in contigs if contig not in digests]
+        if missing:
+            with pysam.FastaFile(reference) as fasta:
+                lengths = dict(zip(fasta.references, fasta.lengths))
+                for contig in missing:
+                    if contig in lengths:
+                        digests[contig] = _cache_sequence(fasta, contig, lengths[contig], cache_dir)
+
+            # Keep the contigs other processes cached in the meantime
+            for contig, digest in _read_manifest(manifest, cache_dir).items():
+                digests.setdefault(contig, digest)
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = manifest.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp_path, 'w') as f:
+                f.write(''.join(f"{contig}\t{digest}\n" for contig, digest in sorted(digests.items())))
+            os.replace(tmp_path, manifest)
+        return {contig: digests[contig] for contig in contigs if contig in digests}
+
+
+def _cache_sequence(fasta, contig, length, cache_dir):
+    """Write one contig to a temporary file, then move it under its MD5"""
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_dir / f"{contig.replace(os.sep, '_')}.{os.getpid()}.tmp"
+    md5 = hashlib.md5()
+    try:
+        with open(tmp_path, 'wb') as f:
+            for start in range(0, length, CHUNK_SIZE):
+                chunk = fasta.fetch(contig, start, min(start + CHUNK_SIZE, length)).upper().encode()
+                md5.update(chunk)
+                f.write(chunk)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    digest = md5.hexdigest()
+    path = _sequence_path(cache_dir, digest)
+    if path.exists():
+        os.remove(tmp_path)
+    else:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp_path, path)
+    return digest
+
+
+def use_reference_cache(cache_dir):
+    """Point htslib's REF_CACHE at cache_dir and search it first on REF_PATH
+
+    This changes the process environment, so call it once at start-up,
+    before any thread or worker process opens a CRAM. Setting REF_PATH also
+    keeps htslib from downloading sequences the cache does not hold, unless
+    the user's own REF_PATH asks for it.
+    """
+    pattern = cache_pattern(cache_dir)
+    os.environ['REF_CACHE'] = pattern
+    ref_path = os.environ.get('REF_PATH')
+    if not ref_path:
+        os.environ['REF_PATH'] = pattern
+    elif pattern not in ref_path.split(':'):
+        os.environ['REF_PATH'] = f"{pattern}:{ref_path}"
+
+
+def reference_cache_in_use(cache_dir):
+    """Whether ``use_reference_cache`` pointed htslib at cache_dir"""
+    return os.environ.get('REF_CACHE') == cache_pattern(cache_dir)
@@ -1,3 +1,6 @@
+from ..profiling import NULL_PROFILER
+
+
 class BaseRenderer:
     """Base renderer with common functionality"""
     def __init__(self, colors, image_width, read_height=None, track_spacing=None):
@@ -20,9 +23,19 @@ class BaseRenderer:
         }
         
         self.target_aspect_ratio = 16/9
+        
+        # Stage timings and counts, see utils.profiling
+        self.profiler = NULL_PROFILER
 
-    def calculate_dimensions(self, forward_tracks, reverse_tracks):
-        """Calculate optimal dimensions for visualization"""
+    def calculate_dimensions(self, forward_tracks, reverse_tracks, max_total_height=None):
+        """Calculate optimal dimensions for visualization
+        
+        Args:
+            max_total_height (float, optional): Height budget, defaults to
+                self.max_total_height
+        """
+        if max_total_height is None:
+            max_total_height = self.max_total_height
         total_tracks = len(forward_tracks) + len(reverse_tracks)
         
         # 计算初始总高度
@@ -31,9 +44,9 @@ class BaseRenderer:
                           self.margin['bottom'])
         
         # 如果潜在高度超过最大值，进行压缩
-        if potential_height > self.max_total_height:
+        if potential_height > max_total_height:
             # 计算可用高度(不包括边距)
-            available_height = self.max_total_height - self.margin['top'] - self.margin['bottom']
+            available_height = max_total_height - self.margin['top'] - self.margin['bottom']
             
             # 最小高度配置
             min_read_height = 0.5  # 最小read高度
@@ -50,12 +63,11 @@ class BaseRenderer:
             self.read_height = max(min_read_height, self.read_height * ratio)
             self.track_spacing = max(min_track_spacing, self.track_spacing * ratio)
             
-            # 如果压缩后的高度超过max_total_height，更新max_total_height为最小值
-            if min_total_height > self.max_total_height:
-                self.max_total_height = min_total_height
+            # 如果压缩后的高度超过max_total_height，返回最小高度
+            if min_total_height > max_total_height:
                 return min_total_height
             
-            return self.max_total_height
+            return max_total_height
             
         # 如果不需要压缩，返回原始高度
         return potential_height
@@ -75,10 +87,20 @@ class BaseRenderer:
             'read_height': self.read_height,
             'track_spacing': self.track_spacing,
             'colors': self.colors,
-            'tracks': {
-                'forward': [],
-                'reverse': []
-            }
+            'tracks': self._layout_tracks(forward_tracks, reverse_tracks)[0]
+        }
+            
+        return render_data
+
+    def _layout_tracks(self, forward_tracks, reverse_tracks):
+        """Assign y offsets to forward then reverse tracks
+        
+        Returns:
+            tuple: (dict, float) track data per direction and the height used
+        """
+        tracks = {
+            'forward': [],
+            'reverse': []
         }
         
         # 计算起始位置
@@ -87,7 +109,7 @@ class BaseRenderer:
         # Forward reads
         for i, track in enumerate(forward_tracks):
             y = current_y + (i * (self.read_height + self.track_spacing))
-            render_data['tracks']['forward'].append({
+            tracks['forward'].append({
                 'track': track,
                 'y': y
             })
@@ -98,14 +120,15 @@ class BaseRenderer:
         # Reverse reads
         for i, track in enumerate(reverse_tracks):
             y = current_y + (i * (self.read_height + self.track_spacing))
-            render_data['tracks']['reverse'].append({
+            tracks['reverse'].append({
                 'track': track,
                 'y': y
             })
-            
-        return render_data
+        
+        current_y += len(reverse_tracks) * (self.read_height + self.track_spacing)
+        return tracks, current_y
 
-    def render(self, forward_tracks, reverse_tracks, output_path, title):
+    def render(self, forward_tracks, reverse_tracks, output_path, title, coverage=None):
         """
         Abstract method to be implemented by specific renderers
         """
@@ -70,14 +70,14 @@ class PNGRenderer(BaseRenderer):
 
     def draw_read(self, draw, track, y_pos):
         """Draw a single read with exons and intron lines"""
-        x_start, x_end, _, read, blocks = track
+        x_start, x_end = track.x_start, track.x_end
         
         # Draw thin line for full read length (intron connection)
         draw.line([(x_start, y_pos), (x_end, y_pos)], 
                  fill=self.colors['background'], width=1)
         
         # Draw thicker blocks for exons
-        for block_start, block_end in blocks:
+        for block_start, block_end, _ in track.blocks:
             draw.line([(block_start, y_pos), (block_end, y_pos)],
-                     fill=self.colors['F' if not read.is_reverse else 'R'],
+                     fill=self.colors['F' if not track.is_reverse else 'R'],
                      width=self.read_height) 
\ No newline at end of file
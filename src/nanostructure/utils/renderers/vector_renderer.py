@@ -1,14 +1,65 @@
 import svgwrite
-import cairosvg
 from pathlib import Path
 from .base_renderer import BaseRenderer
-from ...config import TITLE
+from ...config import TITLE, COORDINATES
+
+
+def _import_cairosvg():
+    """Import cairosvg (and the native Cairo library) only for PNG/PDF output"""
+    try:
+        import cairosvg
+    except (ImportError, OSError) as e:
+        raise ImportError(
+            "PNG/PDF output requires cairosvg and the Cairo library; "
+            "install with: pip install 'nanostructure[cairo]', or write .svg"
+        ) from e
+    return cairosvg
+
+
+def _fmt(value):
+    """Format an SVG coordinate compactly (at most two decimals)"""
+    return f"{value:.2f}".rstrip('0').rstrip('.')
+
 
 class VectorRenderer(BaseRenderer):
     """Vector format (SVG/PDF) renderer implementation"""
     
-    def render(self, forward_tracks, reverse_tracks, output_path, title=None):
-        """Render tracks to SVG/PDF format"""
+    # CSS classes for highlighted block types; everything else is drawn
+    # with the strand colour (match-F / match-R)
+    BLOCK_CLASSES = {
+        'mismatch': 'mm',
+        'insertion': 'ins',
+        'deletion': 'del',
+    }
+    # Paint order of the per-row paths, later classes are drawn on top
+    BLOCK_ORDER = ('match', 'del', 'ins', 'mm')
+    
+    COVERAGE_HEIGHT = COORDINATES['dimensions']['coverage_height']
+    COVERAGE_MARGIN = COORDINATES['dimensions']['coverage_margin']
+    PANEL_LABEL_HEIGHT = COORDINATES['dimensions']['panel_label_height']
+    PANEL_GAP = COORDINATES['dimensions']['panel_gap']
+    
+    def render(self, forward_tracks, reverse_tracks, output_path, title=None, coverage=None):
+        """Render tracks to SVG/PDF format
+        
+        Args:
+            coverage (CoverageTrack, optional): Drawn as a depth track above the reads
+        """
+        panel = {
+            'label': None,
+            'forward': forward_tracks,
+            'reverse': reverse_tracks,
+            'coverage': coverage
+        }
+        self.render_panels([panel], output_path, title)
+    
+    def render_panels(self, panels, output_path, title=None):
+        """Render one stacked panel per sample under a shared axis and gene model
+        
+        Args:
+            panels (list of dict): Each with 'label' (str or None), 'forward'
+                and 'reverse' track lists and 'coverage' (CoverageTrack or None)
+        """
         title_data = {
             'text': title,
             'position': (TITLE['left'], TITLE['top']),
@@ -18,13 +69,42 @@ class VectorRenderer(BaseRenderer):
         
         title_height = title_data['font_size'] * 1.5 if title else 0
         
-        render_data = self._render_common(forward_tracks, reverse_tracks, None)
+        # Every panel gets the height budget of a single render, and all
+        # panels share the resulting read height so samples stay comparable
+        with self.profiler.stage('render.layout'):
+            self.calculate_dimensions(
+                [track for panel in panels for track in panel['forward']],
+                [track for panel in panels for track in panel['reverse']],
+                max_total_height=self.max_total_height * len(panels)
+            )
+            layouts = [self._layout_tracks(panel['forward'], panel['reverse']) for panel in panels]
         
-        # Add bottom margin (e.g., 20 pixels)
-        render_data['dimensions']['height'] += 100
+        # Size the canvas from the laid-out panels, since calculate_dimensions
+        # may clamp the read height above what max_total_height allows
+        image_height = sum(panel_height for _, panel_height in layouts)
+        image_height += self.PANEL_GAP * (len(panels) - 1) + self.margin['bottom']
+        render_data = {
+            'dimensions': {
+                'width': self.image_width,
+                'height': image_height
+            }
+        }
+        
+        # Clearance below the reads: 100 pixels, less the 20-pixel strand
+        # gap the last panel's height already includes
+        render_data['dimensions']['height'] += 80
+        
+        if hasattr(self, 'coordinates'):
+            render_data['dimensions']['height'] += self.coordinates.gene_structure_extra_height()
         
         if title:
             render_data['dimensions']['height'] += title_height
+        
+        for panel in panels:
+            if panel['coverage'] is not None:
+                render_data['dimensions']['height'] += self.COVERAGE_HEIGHT + self.COVERAGE_MARGIN
+            if panel['label']:
+                render_data['dimensions']['height'] += self.PANEL_LABEL_HEIGHT
             
         dwg = self._create_drawing(output_path, render_data)
         
@@ -34,17 +114,33 @@ class VectorRenderer(BaseRenderer):
         title_offset = title_height if title else 0
         
         if hasattr(self, 'coordinates'):
-            gene_y = self._draw_coordinates(dwg, title_offset)
+            with self.profiler.stage('render.axis'):
+                gene_y = self._draw_coordinates(dwg, title_offset)
         
-        # Pass gene_y to _draw_tracks
-        self._draw_tracks(dwg, render_data['tracks'], gene_y)
+        for panel, (tracks, panel_height) in zip(panels, layouts):
+            if panel['label']:
+                gene_y = self._draw_panel_label(dwg, panel['label'], gene_y)
+            
+            if panel['coverage'] is not None:
+                with self.profiler.stage('render.coverage'):
+                    gene_y = self._draw_coverage(dwg, panel['coverage'], gene_y)
+            
+            # Pass gene_y to _draw_tracks
+            with self.profiler.stage('render.tracks'):
+                self._draw_tracks(dwg, tracks, gene_y)
+            gene_y += panel_height + self.PANEL_GAP
         
-        self._save_drawing(dwg, output_path)
+        self.profiler.count('svg.elements', len(dwg.elements))
+        with self.profiler.stage('render.save'):
+            self._save_drawing(dwg, output_path)
     
     def _create_drawing(self, output_path, render_data):
         """Create and initialize the SVG drawing"""
+        # debug=False skips svgwrite's per-attribute validation, which costs
+        # more than building the elements themselves
         dwg = svgwrite.Drawing(output_path, size=(render_data['dimensions']['width'],
-                                                render_data['dimensions']['height']))
+                                                render_data['dimensions']['height']),
+                               debug=False)
         
         # Add metadata using text elements in a hidden group
         metadata = dwg.g(style="display:none")
@@ -58,8 +154,29 @@ class VectorRenderer(BaseRenderer):
                         size=(render_data['dimensions']['width'],
                               render_data['dimensions']['height']),
                         fill=self.colors['background']))
+        
+        self._add_track_styles(dwg)
         return dwg
     
+    def _add_track_styles(self, dwg):
+        """Define shared CSS classes for read backbones and blocks
+        
+        Every read row references these classes instead of repeating the
+        stroke/fill attributes on each element.
+        """
+        blocks = self.colors['blocks']
+        reads = self.colors['reads']
+        css = (
+            f".intron{{fill:none;stroke:{blocks['intron']};stroke-width:1}}"
+            f".block{{fill:none;stroke-width:{_fmt(self.read_height)}}}"
+            f".match-F{{stroke:{reads['F']}}}"
+            f".match-R{{stroke:{reads['R']}}}"
+            f".mm{{stroke:{blocks['mismatch']}}}"
+            f".ins{{stroke:{blocks['insertion']}}}"
+            f".del{{stroke:{blocks['deletion']}}}"
+        )
+        dwg.defs.add(dwg.style(css))
+    
     def _draw_coordinates(self, dwg, title_offset):
         """Draw coordinate system including axis, ticks, and labels"""
         coord = self.coordinates
@@ -122,14 +239,26 @@ class VectorRenderer(BaseRenderer):
     
     def _draw_gene_structure(self, dwg, coord, axis_y):
         """Draw gene structure including introns and exons"""
-        gene_data, gene_y_end = coord.draw_gene_structure(axis_y)
-        if not gene_data:
-            return None
+        transcripts, gene_y_end = coord.draw_gene_structure(axis_y)
+        if not transcripts:
+            # No gene model, keep the reads clear of the axis labels
+            return gene_y_end + coord.LABEL_HEIGHT + coord.GENE_STRUCTURE_MARGIN
             
-        # Draw gene components
-        if gene_data['gene_name'] and gene_data['intron_line']:
-            self._draw_gene_name_and_intron(dwg, gene_data)
-        self._draw_exons(dwg, gene_data)
+        # Draw gene components, one row per stacked transcript
+        for gene_data in transcripts:
+            if gene_data['gene_name'] and gene_data['intron_line']:
+                self._draw_gene_name_and_intron(dwg, gene_data)
+            self._draw_exons(dwg, gene_data)
+        
+        omitted = coord.omitted_transcripts
+        if omitted:
+            # Say the gene model is incomplete rather than drop rows silently
+            self.profiler.count('transcripts.omitted', omitted)
+            dwg.add(dwg.text(f"+{omitted} transcript{'s' if omitted > 1 else ''} not shown",
+                            insert=(2, gene_y_end - 4),
+                            font_family='Arial',
+                            font_size='12px',
+                            fill=transcripts[0]['style']['text_color']))
         
         return gene_y_end
     
@@ -166,69 +295,115 @@ class VectorRenderer(BaseRenderer):
                 fill_opacity=gene_data['style'].get('exon_opacity', 1)
             ))
     
+    def _draw_panel_label(self, dwg, label, top_y):
+        """Draw a sample name above its panel and return the y below it"""
+        dwg.add(dwg.text(label,
+                        insert=(2, top_y + self.PANEL_LABEL_HEIGHT - 4),
+                        font_family='Arial',
+                        font_size='12px',
+                        font_weight='bold',
+                        fill=self.colors['label']))
+        return top_y + self.PANEL_LABEL_HEIGHT
+    
+    def _draw_coverage(self, dwg, coverage, top_y):
+        """Draw binned coverage bars with mismatch-fraction highlights
+        
+        Returns:
+            float: y offset at which the read tracks start
+        """
+        coverage_data = coverage.get_render_data(self.image_width)
+        y = top_y + self.margin['top']
+        bottom = y + self.COVERAGE_HEIGHT
+        max_depth = coverage_data['max_depth']
+        
+        depth_path = []
+        mismatch_path = []
+        for x_start, x_end, depth, mismatch_fraction in coverage_data['bars']:
+            bar_height = self.COVERAGE_HEIGHT * depth / max_depth
+            width = x_end - x_start
+            depth_path.append(f"M{x_start} {_fmt(bottom - bar_height)}h{width}V{_fmt(bottom)}h{-width}z")
+            if mismatch_fraction:
+                mismatch_height = bar_height * mismatch_fraction
+                mismatch_path.append(f"M{x_start} {_fmt(bottom - mismatch_height)}h{width}V{_fmt(bottom)}h{-width}z")
+        
+        colors = self.colors['coverage']
+        if depth_path:
+            dwg.add(dwg.path(d=''.join(depth_path), fill=colors['fill']))
+        if mismatch_path:
+            dwg.add(dwg.path(d=''.join(mismatch_path), fill=colors['mismatch']))
+        
+        dwg.add(dwg.text(f"[0-{max_depth}]",
+                        insert=(2, y + 10),
+                        font_family='Arial',
+                        font_size='10px',
+                        fill=colors['label']))
+        
+        return top_y + self.COVERAGE_HEIGHT + self.COVERAGE_MARGIN
+    
     def _draw_tracks(self, dwg, tracks_data, gene_y):
-        """Draw forward and reverse tracks"""
-        # 添加总计数器
-        total_counts = {
-            'match': 0,
-            'mismatch': 0,
-            'insertion': 0,
-            'deletion': 0,
-            'soft_clip': 0,
-            'hard_clip': 0,
-            'skip': 0
-        }
+        """Draw forward and reverse tracks
         
+        With a profiler attached, the drawn blocks are counted per operation
+        type (``blocks.match``, ``blocks.mismatch``, ...).
+        """
         track_start_y = gene_y
+        counting = self.profiler.enabled
+        total_counts = {}
         
         for direction in ['forward', 'reverse']:
             color_key = 'F' if direction == 'forward' else 'R'
             for track_data in tracks_data[direction]:
-                # 统计每个block的操作类型
-                for _, _, op_type in track_data['track'][4]:  # blocks在track[4]
-                    total_counts[op_type] += 1
-                self._draw_single_track(dwg, track_data, track_start_y, self.colors['reads'][color_key])
+                if counting:
+                    for _, _, op_type in track_data['track'].blocks:
+                        total_counts[op_type] = total_counts.get(op_type, 0) + 1
+                self._draw_single_track(dwg, track_data, track_start_y, color_key)
         
-        # 只打印总计
-        print("\n=== Operation Statistics ===")
         for op_type, count in total_counts.items():
-            print(f"{op_type}: {count}")
+            self.profiler.count(f'blocks.{op_type}', count)
     
-    def _draw_single_track(self, dwg, track_data, track_start_y, base_color):
-        """Draw a single track including intron lines and exon blocks"""
+    def _draw_single_track(self, dwg, track_data, track_start_y, color_key):
+        """Draw a single track as one backbone path plus one path per block colour
+        
+        Blocks are drawn as horizontal strokes (butt caps, stroke width equal
+        to the read height), so a whole row of same-coloured blocks collapses
+        into a single ``<path>`` with one ``M x y H x2`` segment per block.
+        """
         track = track_data['track']
-        x_start, x_end, _, read, blocks = track
-        y = track_data['y'] + track_start_y
+        x_start, x_end, blocks = track.x_start, track.x_end, track.blocks
+        y = _fmt(track_data['y'] + track_start_y + self.read_height/2)
         
         # Draw intron line first (as background)
-        dwg.add(dwg.line(
-            start=(x_start, y + self.read_height/2),
-            end=(x_end, y + self.read_height/2),
-            stroke='#A6A6A6',
-            stroke_width=1
-        ))
+        dwg.add(dwg.path(d=f"M{x_start} {y}H{x_end}", class_='intron'))
         
-        # Draw blocks with appropriate colors
+        segments = {}
         for block_start, block_end, op_type in blocks:
-            if op_type == 'skip':
+            if op_type == 'skip' or block_end <= block_start:
                 continue  # Skip already drawn as intron line
-            
-            color = {
-                'match': base_color,
-                'mismatch': '#FF0000',  # Red
-                'insertion': '#304FFE',  # Blue
-                'deletion': '#7DFF6F',   # Green
-            }.get(op_type, base_color)
-            
-            dwg.add(dwg.rect(
-                insert=(block_start, y),
-                size=(block_end - block_start, self.read_height),
-                fill=color
-            ))
+            css_class = self.BLOCK_CLASSES.get(op_type, 'match')
+            runs = segments.setdefault(css_class, [])
+            # Merge touching blocks of the same colour into one run
+            if runs and runs[-1][0] <= block_start <= runs[-1][1]:
+                runs[-1][1] = max(runs[-1][1], block_end)
+            else:
+                runs.append([block_start, block_end])
+        
+        for css_class in self.BLOCK_ORDER:
+            if css_class not in segments:
+                continue
+            if css_class == 'match':
+                class_name = f'block match-{color_key}'
+            else:
+                class_name = f'block {css_class}'
+            path_data = ''.join(f"M{start} {y}H{end}" for start, end in segments[css_class])
+            dwg.add(dwg.path(d=path_data, class_=class_name))
     
     def _save_drawing(self, dwg, output_path):
-        """Save drawing as SVG or convert to PDF"""
-        if output_path.endswith('.pdf'):
+        """Save drawing as SVG or convert to PDF/PNG"""
+        if output_path.endswith('.png'):
+            cairosvg = _import_cairosvg()
+            cairosvg.svg2png(bytestring=dwg.tostring().encode('utf-8'), write_to=output_path)
+        elif output_path.endswith('.pdf'):
+            cairosvg = _import_cairosvg()
             temp_svg = output_path.replace('.pdf', '.svg')
             dwg.saveas(temp_svg)
             try:
@@ -0,0 +1,183 @@
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from .alignment_utils import is_drawable, decode_read, open_alignment_file
+
+
+class TileCache:
+    """Cache of decoded reads per genomic tile
+
+    Each tile holds every drawable read overlapping
+    ``[index * tile_size, (index + 1) * tile_size)`` as ``DecodedRead`` objects
+    in genomic coordinates, so the same tiles serve any zoom level or image
+    width. Tiles live in a memory-bounded LRU and, when ``cache_dir`` is set,
+    are also pickled to disk keyed by BAM path, size, mtime and region.
+    One cache can be shared by threads fetching different BAMs. CRAM
+    reference sequences are cached by MD5 under ``cache_dir/ref``.
+
+    Usage:
+        cache = TileCache(cache_dir='~/.cache/nanostructure')
+        render_alignment_snapshot(bam, position='chr1:1000-5000', cache=cache)
+        render_alignment_snapshot(bam, position='chr1:2000-3000', cache=cache)  # no decoding
+    """
+
+    VERSION = 1
+
+    def __init__(self, tile_size=10000, max_blocks=5000000, cache_dir=None):
+        """
+        Args:
+            tile_size (int): Tile width in bases
+            max_blocks (int): Memory bound, total exon blocks kept in the LRU
+            cache_dir (str, optional): Directory for the on-disk tile cache
+        """
+        self.tile_size = tile_size
+        self.max_blocks = max_blocks
+        self.cache_dir = Path(cache_dir).expanduser() if cache_dir else None
+
+        self._tiles = OrderedDict()
+        self._tile_blocks = {}
+        self.cached_blocks = 0
+        self.stats = {'hits': 0, 'disk_hits': 0, 'misses': 0}
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # Worker processes get an empty copy with the same settings
+        state = self.__dict__.copy()
+        del state['_lock']
+        state['_tiles'] = OrderedDict()
+        state['_tile_blocks'] = {}
+        state['cached_blocks'] = 0
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def fetch(self, bam_path, chrom, start_pos, end_pos, reference=None, threads=1):
+        """Yield decoded reads overlapping [start_pos, end_pos) in BAM fetch order
+
+        Reads spanning a tile boundary are stored in every tile they overlap;
+        they are only taken from the first tile of the query, and later
+        tiles contribute just the reads starting inside them. ``reference``
+        is the FASTA a CRAM ``bam_path`` is decoded against, ``threads`` the
+        htslib decompression threads used on a miss.
+        """
+        bam_key = self._bam_key(bam_path)
+        first_tile = start_pos // self.tile_size
+        last_tile = max(first_tile, (end_pos - 1) // self.tile_size)
+
+        bam = None
+        try:
+            for tile_index in range(first_tile, last_tile + 1):
+                key = (bam_key, chrom, tile_index)
+                reads = self._get(key)
+                if reads is None:
+                    if bam is None:
+                        bam = open_alignment_file(bam_path, reference, self.reference_cache, [chrom], threads)
+                    reads = self._decode_tile(bam, chrom, tile_index)
+                    self._put(key, reads)
+
+                tile_start = tile_index * self.tile_size
+                for read in reads:
+                    if tile_index == first_tile:
+                        if read.reference_end <= start_pos or read.reference_start >= end_pos:
+                            continue
+                    elif read.reference_start < tile_start or read.reference_start >= end_pos:
+                        continue
+                    yield read
+        finally:
+            if bam is not None:
+                bam.close()
+
+    @property
+    def reference_cache(self):
+        """Directory of the CRAM reference sequence cache, if on disk
+
+        Only used once ``use_reference_cache`` pointed htslib at it.
+        """
+        return self.cache_dir / 'ref' if self.cache_dir is not None else None
+
+    def clear(self):
+        """Drop all in-memory tiles"""
+        with self._lock:
+            self._tiles.clear()
+            self._tile_blocks.clear()
+            self.cached_blocks = 0
+
+    def _decode_tile(self, bam, chrom, tile_index):
+        tile_start = tile_index * self.tile_size
+        return [
+            decode_read(read)
+            for read in bam.fetch(chrom, tile_start, tile_start + self.tile_size)
+            if is_drawable(read)
+        ]
+
+    def _bam_key(self, bam_path):
+        stat = os.stat(bam_path)
+        return (os.path.abspath(bam_path), stat.st_size, stat.st_mtime_ns)
+
+    def _get(self, key):
+        with self._lock:
+            reads = self._tiles.get(key)
+            if reads is not None:
+                self._tiles.move_to_end(key)
+                self.stats['hits'] += 1
+                return reads
+
+        reads = self._load(key)
+        if reads is not None:
+            self._remember(key, reads)
+            with self._lock:
+                self.stats['disk_hits'] += 1
+            return reads
+
+        with self._lock:
+            self.stats['misses'] += 1
+        return None
+
+    def _put(self, key, reads):
+        self._remember(key, reads)
+        self._save(key, reads)
+
+    def _remember(self, key, reads):
+        blocks = sum(len(read.exon_blocks) for read in reads)
+        with self._lock:
+            if key in self._tiles:  # Decoded concurrently by another thread
+                return
+            self._tiles[key] = reads
+            self._tile_blocks[key] = blocks
+            self.cached_blocks += blocks
+
+            # Evict least recently used tiles, always keeping the newest one
+            while self.cached_blocks > self.max_blocks and len(self._tiles) > 1:
+                old_key, _ = self._tiles.popitem(last=False)
+                self.cached_blocks -= self._tile_blocks.pop(old_key)
+
+    def _disk_path(self, key):
+        digest = hashlib.sha1(repr((self.VERSION, self.tile_size) + key).encode()).hexdigest()
+        return self.cache_dir / digest[:2] / f"{digest}.tile"
+
+    def _load(self, key):
+        if self.cache_dir is None:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'rb') as f:
+                return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def _save(self, key, reads):
+        if self.cache_dir is None:
+            return
+        path = self._disk_path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write then rename so concurrent readers never see a partial tile
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(reads, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
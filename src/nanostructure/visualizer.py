@@ -1,4 +1,5 @@
 import json
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from .utils.drawing_utils import render_genomic_coordinates
 from .utils.alignment_utils import collect_read_alignments
@@ -7,6 +8,7 @@ from .utils.renderers.vector_renderer import VectorRenderer
 from .utils.coordinates.gene_coordinates import GeneCoordinates
 from .utils.coordinates.drawing_coordinates import DrawingCoordinates
 from .utils.coordinates.scale import XScale
+from .utils.profiling import NULL_PROFILER
 from .config import COLORS
 
 def parse_position(position_str):
@@ -18,73 +20,164 @@ def parse_position(position_str):
     except:
         raise ValueError("Position must be in format 'chr1:1000-2000'")
 
-def render_alignment_snapshot(bam_path, position=None, transcript=None, output_path=None, 
+def sample_label(bam_path):
+    """Panel label for a BAM path or open AlignmentFile"""
+    path = getattr(bam_path, 'filename', bam_path)
+    if isinstance(path, bytes):
+        path = path.decode()
+    return Path(path).name.split('.')[0]
+
+def render_alignment_snapshot(bam_path, position=None, transcript=None, gene=None, output_path=None, 
                             title=None, strand_direction="B", format="svg",
                             image_width=1000, read_height=None, track_spacing=None,
                             gtf_file=None, max_reads=100, flanking=100,
-                            read_display_method='continuous'):
-    """Generate alignment visualization snapshot for specified genomic region or transcript
+                            read_display_method='continuous', show_coverage=True,
+                            mismatch_threshold=0.2, seed=None, cache=None,
+                            sample_names=None, workers=None, profiler=None, isoforms='stacked',
+                            reference=None, io_threads=1):
+    """Generate alignment visualization snapshot for specified genomic region, transcript or gene
     
     Args:
+        bam_path (str, pysam.AlignmentFile or list): BAM or CRAM path or an open
+            handle to reuse; a list renders one stacked panel per BAM under a
+            shared axis and gene model
+        gene (str, optional): gene_id or gene name to render with all of its
+            isoforms, requires gtf_file
         ...
         read_display_method (str): How to handle many reads:
             - 'continuous': Similar to IGV, pack reads continuously (default)
-            - 'downsample': Randomly sample max_reads number of reads
+            - 'downsample': Randomly sample max_reads number of reads while
+              fetching; only sampled reads are decoded
             - '3_end': Sort by 3' end and take top max_reads
             - '5_end': Sort by 5' end and take top max_reads
+        show_coverage (bool): Draw a coverage track above the reads, computed
+            in the same BAM pass as the read tracks
+        mismatch_threshold (float): Coverage columns whose mismatch fraction
+            reaches this value are highlighted
+        seed (int, optional): Random seed for 'downsample'
+        cache (TileCache, optional): Reuse decoded reads across renders of
+            overlapping regions, at any zoom level or image width
+        sample_names (list, optional): Panel labels for a list of BAMs,
+            defaults to the file names
+        workers (int, optional): Threads fetching the BAMs concurrently,
+            defaults to one per BAM (at most 16)
+        profiler (StageProfiler, optional): Records the time of each stage
+            (annotation, collect, render) and read/block/SVG element counts
+        isoforms (str): How a gene's transcripts are drawn, 'stacked' one row
+            each or 'collapsed' into a single model
+        reference (str, optional): Reference FASTA the CRAM inputs were encoded
+            against; with a cache on disk set up by ``use_reference_cache``
+            the contigs read are cached by MD5
+        io_threads (int): htslib threads decompressing each BAM, on top of
+            the per-BAM fetch workers
     """
+    if profiler is None:
+        profiler = NULL_PROFILER
     
-    coord = DrawingCoordinates(
-        width=image_width,
-        height=50 
-    )
-    
-    if transcript and gtf_file:
-        coords = coord.get_transcript_coordinates(gtf_file, transcript)
-        coords['start'] -= flanking
-        coords['end'] += flanking
-        coord.set_gene_annotation(gtf_file)
-    elif position:
-        coords = parse_position(position)
-    else:
-        raise ValueError("Either position or both transcript and gtf_file must be provided")
+    with profiler.profile():
+        coord = DrawingCoordinates(
+            width=image_width,
+            height=50 
+        )
     
-    if coords['start'] > coords['end']:
-        coords['start'], coords['end'] = coords['end'], coords['start']
+        if transcript and gtf_file:
+            with profiler.stage('annotation'):
+                # Also sets the transcript's features as the gene annotation
+                coords = coord.get_transcript_coordinates(
+                    gtf_file, transcript,
+                    cache_dir=cache.cache_dir if cache is not None else None
+                )
+                coords['start'] -= flanking
+                coords['end'] += flanking
+        elif gene and gtf_file:
+            with profiler.stage('annotation'):
+                coords = coord.get_gene_coordinates(
+                    gtf_file, gene, isoforms=isoforms,
+                    cache_dir=cache.cache_dir if cache is not None else None
+                )
+                coords['start'] -= flanking
+                coords['end'] += flanking
+        elif position:
+            coords = parse_position(position)
+            if gtf_file:
+                with profiler.stage('annotation'):
+                    # All transcripts overlapping the region, via the cached interval index
+                    coord.set_region_annotation(
+                        gtf_file, coords['chrom'], min(coords['start'], coords['end']),
+                        max(coords['start'], coords['end']),
+                        cache_dir=cache.cache_dir if cache is not None else None
+                    )
+        else:
+            raise ValueError("Either position, or transcript or gene together with gtf_file must be provided")
     
-    # update coordinates
-    coord.chrom = coords['chrom']
-    coord.start_pos = coords['start']
-    coord.end_pos = coords['end']
+        if coords['start'] > coords['end']:
+            coords['start'], coords['end'] = coords['end'], coords['start']
     
-    xscale = XScale(coords['start'], coords['end'], image_width)
-    coord.xscale = xscale
+        # update coordinates
+        coord.chrom = coords['chrom']
+        coord.start_pos = coords['start']
+        coord.end_pos = coords['end']
     
-    # collect read alignments
-    forward_tracks, reverse_tracks = collect_read_alignments(
-        bam_path, coords['chrom'], coords['start'], coords['end'], 
-        image_width, max_reads=max_reads, method=read_display_method
-    )
+        xscale = XScale(coords['start'], coords['end'], image_width)
+        coord.xscale = xscale
     
-    # filter tracks by strand_direction
-    if strand_direction == "F":
-        reverse_tracks = []
-    elif strand_direction == "R":
-        forward_tracks = []
-    elif strand_direction != "B":
-        raise ValueError('strand_direction must be one of: "F", "R", "B"')
+        if strand_direction not in ("F", "R", "B"):
+            raise ValueError('strand_direction must be one of: "F", "R", "B"')
     
-    forward_tracks.sort(key=lambda x: (x[0], (x[1] - x[0])))
-    reverse_tracks.sort(key=lambda x: (x[0], (x[1] - x[0])))
+        def fetch_panel(path):
+            coverage = None
+            if show_coverage:
+                from .utils.coverage_utils import CoverageTrack
+                coverage = CoverageTrack(coords['start'], coords['end'],
+                                         mismatch_threshold=mismatch_threshold)
+        
+            with profiler.stage('collect'):
+                # collect read alignments
+                forward_tracks, reverse_tracks = collect_read_alignments(
+                    path, coords['chrom'], coords['start'], coords['end'], 
+                    image_width, max_reads=max_reads, method=read_display_method,
+                    coverage=coverage, seed=seed, cache=cache, profiler=profiler,
+                    reference=reference, threads=io_threads
+                )
+            
+                # filter tracks by strand_direction
+                if strand_direction == "F":
+                    reverse_tracks = []
+                elif strand_direction == "R":
+                    forward_tracks = []
+            
+                forward_tracks.sort(key=lambda x: (x.x_start, (x.x_end - x.x_start)))
+                reverse_tracks.sort(key=lambda x: (x.x_start, (x.x_end - x.x_start)))
+                if coverage is not None:
+                    with profiler.stage('collect.coverage'):
+                        coverage.finalize()
+        
+            return {
+                'label': None,
+                'forward': forward_tracks,
+                'reverse': reverse_tracks,
+                'coverage': coverage
+            }
     
+        if isinstance(bam_path, (list, tuple)):
+            if sample_names and len(sample_names) != len(bam_path):
+                raise ValueError("sample_names must have one name per BAM file")
+            # pysam releases the GIL while decompressing, so the fetches overlap
+            with ThreadPoolExecutor(max_workers=workers or min(len(bam_path), 16)) as executor:
+                panels = list(executor.map(fetch_panel, bam_path))
+            for i, panel in enumerate(panels):
+                panel['label'] = sample_names[i] if sample_names else sample_label(bam_path[i])
+        else:
+            panels = [fetch_panel(bam_path)]
     
-    # if format.lower() == "png":
-    #     renderer = PNGRenderer(colors, image_width, read_height, track_spacing)
-    # else:
-    renderer = VectorRenderer(COLORS, image_width, read_height, track_spacing)
+        # if format.lower() == "png":
+        #     renderer = PNGRenderer(colors, image_width, read_height, track_spacing)
+        # else:
+        renderer = VectorRenderer(COLORS, image_width, read_height, track_spacing)
     
-    renderer.coordinates = coord
-    coord.renderer = renderer
+        renderer.coordinates = coord
+        renderer.profiler = profiler
+        coord.renderer = renderer
     
-    renderer.render(forward_tracks, reverse_tracks, output_path, title)
-
+        with profiler.stage('render'):
+            renderer.render_panels(panels, output_path, title)